@@ -0,0 +1,131 @@
+"""create initial tables and join indexes
+
+Revision ID: 3acd9ec7fffa
+Revises:
+Create Date: 2026-10-19 17:05:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3acd9ec7fffa'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+LINK_UNIQUE_NAME = 'uq_micropost_categories_micropost_id_category_id'
+
+
+def create_index_concurrently(name: str, table: str, columns: str, unique: bool = False, using: str = 'btree') -> None:
+    """インデックスをテーブルをロックせずに作成する（autocommit_block の中で呼び出すこと）"""
+    # CONCURRENTLY の作成に失敗すると INVALID なインデックスが残るため、削除してから作り直す
+    invalid = op.get_bind().execute(sa.text("""
+        SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+        WHERE c.relname = :name AND NOT i.indisvalid
+    """), {'name': name}).scalar()
+    if invalid:
+        op.execute(f'DROP INDEX CONCURRENTLY {name}')
+    op.execute(
+        f'CREATE {"UNIQUE " if unique else ""}INDEX CONCURRENTLY IF NOT EXISTS {name} '
+        f'ON {table} USING {using} ({columns})'
+    )
+
+
+def upgrade() -> None:
+    # READMEのDDLで作成済みのデータベースにも適用できるよう、存在しないテーブルだけを作成する
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('users'):
+        op.create_table('users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if not inspector.has_table('microposts'):
+        op.create_table('microposts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if not inspector.has_table('categories'):
+        op.create_table('categories',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if not inspector.has_table('micropost_categories'):
+        op.create_table('micropost_categories',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('micropost_id', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['micropost_id'], ['microposts.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if not inspector.has_table('category_stats'):
+        op.create_table('category_stats',
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('post_count', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('latest_micropost_id', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('category_id')
+        )
+
+    # 一意インデックスを作成できるよう、重複したリンクを削除する（最も古いものを残す）
+    deleted = op.get_bind().execute(sa.text("""
+        DELETE FROM micropost_categories a USING micropost_categories b
+        WHERE a.micropost_id = b.micropost_id AND a.category_id = b.category_id AND a.id > b.id
+    """)).rowcount
+    if deleted:
+        # 重複リンクも数えていた category_stats を、残ったリンクから数え直す（services.refresh_category_stats と同じ集計）
+        op.execute("""
+            INSERT INTO category_stats (category_id, post_count, latest_micropost_id, updated_at)
+            SELECT c.id, count(mc.micropost_id), max(mc.micropost_id), now()
+            FROM categories c
+            LEFT JOIN micropost_categories mc ON mc.category_id = c.id
+            GROUP BY c.id
+            ON CONFLICT (category_id) DO UPDATE SET
+                post_count = EXCLUDED.post_count,
+                latest_micropost_id = EXCLUDED.latest_micropost_id,
+                updated_at = EXCLUDED.updated_at
+        """)
+
+    # 稼働中のデータベースに書き込みを止めずに適用できるよう、インデックスは CONCURRENTLY で作成する
+    # （CONCURRENTLY はトランザクション内で実行できないため autocommit_block を使う）
+    with op.get_context().autocommit_block():
+        # get_categories_for_micropost: micropost_id で絞り込む（重複リンクの防止も兼ねる）
+        create_index_concurrently(LINK_UNIQUE_NAME, 'micropost_categories', 'micropost_id, category_id', unique=True)
+        # get_microposts_for_category: category_id で絞り込む
+        create_index_concurrently('ix_micropost_categories_category_id_micropost_id', 'micropost_categories',
+                                  'category_id, micropost_id')
+        create_index_concurrently('ix_microposts_user_id', 'microposts', 'user_id')
+        # search_microposts の全文検索
+        create_index_concurrently('microposts_content_tsv_idx', 'microposts', "to_tsvector('simple', content)",
+                                  using='gin')
+
+    # 作成済みの一意インデックスを制約として登録する（インデックスの再構築は行わない）
+    op.execute(f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = '{LINK_UNIQUE_NAME}') THEN
+                ALTER TABLE micropost_categories ADD CONSTRAINT {LINK_UNIQUE_NAME} UNIQUE USING INDEX {LINK_UNIQUE_NAME};
+            END IF;
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    op.execute(f'ALTER TABLE micropost_categories DROP CONSTRAINT IF EXISTS {LINK_UNIQUE_NAME}')
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS microposts_content_tsv_idx')
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_microposts_user_id')
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_micropost_categories_category_id_micropost_id')
+    op.drop_table('category_stats')
+    op.drop_table('micropost_categories')
+    op.drop_table('categories')
+    op.drop_table('microposts')
+    op.drop_table('users')
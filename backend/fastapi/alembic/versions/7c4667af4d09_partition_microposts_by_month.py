@@ -0,0 +1,153 @@
+"""partition microposts by month (opt-in)
+
+Revision ID: 7c4667af4d09
+Revises: bf283a466aee
+Create Date: 2026-10-19 17:48:03.251774
+
+パーティション化は明示的に指定した場合だけ行う:
+    alembic -x partitioned=true upgrade head
+指定せずに適用した後で有効にする場合は、1つ戻してから指定して適用し直す:
+    alembic downgrade bf283a466aee && alembic -x partitioned=true upgrade head
+
+パーティションテーブルでは id だけの一意制約を作れないため、micropost_categories.micropost_id の
+外部キーは削除し、投稿の削除時にリンクを削除する処理はトリガーで代替する。
+テーブル全体をコピーするため、適用中は microposts への書き込みが止まる。
+"""
+from datetime import date, timedelta
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c4667af4d09'
+down_revision = 'bf283a466aee'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+
+def is_partitioned() -> bool:
+    return bool(op.get_bind().execute(sa.text("""
+        SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'microposts'::regclass
+    """)).scalar())
+
+
+def next_month(month: date) -> date:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def create_monthly_partition(parent: str, month: date) -> None:
+    # src/partitions.py と同じ命名規則（microposts_pYYYYMM）で、UTCの月初から翌月初までを格納する
+    op.execute(
+        f"CREATE TABLE IF NOT EXISTS microposts_p{month:%Y%m} PARTITION OF {parent} "
+        f"FOR VALUES FROM ('{month} 00:00:00+00') TO ('{next_month(month)} 00:00:00+00')"
+    )
+
+
+def create_parent_indexes() -> None:
+    # 親テーブルに作成したインデックスは、既存・今後のすべてのパーティションに作成される
+    op.execute('CREATE INDEX ix_microposts_user_id ON microposts (user_id)')
+    op.execute('CREATE INDEX ix_microposts_created_at ON microposts (created_at)')
+    op.execute("CREATE INDEX microposts_content_tsv_idx ON microposts USING gin (to_tsvector('simple', content))")
+
+
+def drop_link_foreign_keys() -> None:
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys('micropost_categories'):
+        if fk['referred_table'] == 'microposts':
+            op.drop_constraint(fk['name'], 'micropost_categories', type_='foreignkey')
+
+
+def upgrade() -> None:
+    if context.get_x_argument(as_dictionary=True).get('partitioned', 'false').lower() != 'true':
+        return
+    if is_partitioned():
+        return
+
+    bind = op.get_bind()
+    op.execute('LOCK TABLE microposts IN ACCESS EXCLUSIVE MODE')
+    sequence = bind.execute(sa.text("SELECT pg_get_serial_sequence('microposts', 'id')")).scalar()
+    oldest = bind.execute(sa.text("SELECT min(created_at) FROM microposts")).scalar()
+
+    drop_link_foreign_keys()
+    # 主キーにはパーティションキーを含める必要がある
+    op.execute(f"""
+        CREATE TABLE microposts_partitioned (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+            content TEXT NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    # 既存の投稿がある月から MONTHS_AHEAD か月先までのパーティションを作成する
+    month = (oldest.date() if oldest else date.today()).replace(day=1)
+    last = date.today().replace(day=1)
+    for _ in range(MONTHS_AHEAD):
+        last = next_month(last)
+    while month <= last:
+        create_monthly_partition('microposts_partitioned', month)
+        month = next_month(month)
+    # パーティションが作成されていない期間の投稿を受け取る
+    op.execute('CREATE TABLE microposts_default PARTITION OF microposts_partitioned DEFAULT')
+    op.execute("""
+        INSERT INTO microposts_partitioned (id, content, user_id, created_at)
+        SELECT id, content, user_id, created_at FROM microposts
+    """)
+    op.execute(f'ALTER SEQUENCE {sequence} OWNED BY microposts_partitioned.id')
+    op.execute('DROP TABLE microposts')
+    op.execute('ALTER TABLE microposts_partitioned RENAME TO microposts')
+    op.execute('ALTER TABLE microposts RENAME CONSTRAINT microposts_partitioned_pkey TO microposts_pkey')
+    create_parent_indexes()
+
+    # 外部キーの ON DELETE CASCADE の代わりに、投稿を削除したらカテゴリとのリンクを削除する
+    op.execute("""
+        CREATE OR REPLACE FUNCTION delete_micropost_category_links() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM micropost_categories WHERE micropost_id = OLD.id;
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER microposts_delete_category_links AFTER DELETE ON microposts
+        FOR EACH ROW EXECUTE FUNCTION delete_micropost_category_links()
+    """)
+
+
+def downgrade() -> None:
+    if not is_partitioned():
+        return
+
+    bind = op.get_bind()
+    op.execute('LOCK TABLE microposts IN ACCESS EXCLUSIVE MODE')
+    sequence = bind.execute(sa.text("SELECT pg_get_serial_sequence('microposts', 'id')")).scalar()
+
+    op.execute(f"""
+        CREATE TABLE microposts_plain (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}') PRIMARY KEY,
+            content TEXT NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+    op.execute("""
+        INSERT INTO microposts_plain (id, content, user_id, created_at)
+        SELECT id, content, user_id, created_at FROM microposts
+    """)
+    op.execute(f'ALTER SEQUENCE {sequence} OWNED BY microposts_plain.id')
+    # パーティションも一緒に削除される（切り離し済みのパーティションは残る）
+    op.execute('DROP TABLE microposts')
+    op.execute('DROP FUNCTION IF EXISTS delete_micropost_category_links()')
+    op.execute('ALTER TABLE microposts_plain RENAME TO microposts')
+    op.execute('ALTER TABLE microposts RENAME CONSTRAINT microposts_plain_pkey TO microposts_pkey')
+    create_parent_indexes()
+
+    # 外部キーを戻す前に、切り離したパーティションの投稿を参照しているリンクを削除する
+    op.execute("""
+        DELETE FROM micropost_categories mc
+        WHERE NOT EXISTS (SELECT 1 FROM microposts m WHERE m.id = mc.micropost_id)
+    """)
+    op.create_foreign_key('micropost_categories_micropost_id_fkey', 'micropost_categories', 'microposts',
+                          ['micropost_id'], ['id'], ondelete='CASCADE')
@@ -0,0 +1,30 @@
+"""add created_at to microposts
+
+Revision ID: bf283a466aee
+Revises: 3acd9ec7fffa
+Create Date: 2026-10-19 17:32:40.906127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bf283a466aee'
+down_revision = '3acd9ec7fffa'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # now() は volatile ではないため、PostgreSQL 11 以降は既存行を書き換えずに列を追加できる（既存行の値は適用時刻になる）
+    op.add_column('microposts', sa.Column('created_at', sa.DateTime(timezone=True),
+                                          server_default=sa.text('now()'), nullable=False))
+    with op.get_context().autocommit_block():
+        op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_microposts_created_at ON microposts (created_at)')
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_microposts_created_at')
+    op.drop_column('microposts', 'created_at')
@@ -0,0 +1,36 @@
+"""add latest_created_at to category_stats
+
+Revision ID: e2b7c9d4a1f3
+Revises: 7c4667af4d09
+Create Date: 2026-10-19 18:20:37.514820
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7c9d4a1f3'
+down_revision = '7c4667af4d09'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # NULL 許容でデフォルトなしのため、既存行を書き換えずに列を追加できる
+    op.add_column('category_stats', sa.Column('latest_created_at', sa.DateTime(timezone=True), nullable=True))
+    # 既存のカウンタの値を、リンクされた投稿の作成日時から埋める
+    op.execute("""
+        UPDATE category_stats s SET latest_created_at = latest.created_at
+        FROM (
+            SELECT mc.category_id, max(m.created_at) AS created_at
+            FROM micropost_categories mc
+            JOIN microposts m ON m.id = mc.micropost_id
+            GROUP BY mc.category_id
+        ) latest
+        WHERE latest.category_id = s.category_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('category_stats', 'latest_created_at')
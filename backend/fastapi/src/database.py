@@ -1,5 +1,10 @@
+import itertools
 import os
+import threading
+import time
+from fastapi import Request, Response
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
 from dotenv import load_dotenv
 
 # Load environmental variables from .env file
@@ -9,4 +14,116 @@ DATABASE_URL = os.getenv("DB_URL")
 if not DATABASE_URL:
     raise Exception("DB_URL is not set in the environment (.env file)")
 
+# Upper bound for every statement of a request (milliseconds, PostgreSQL only).
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+
+# Optional read replicas (comma-separated URLs). Without them every request uses DB_URL.
+REPLICA_URLS = [url.strip() for url in os.getenv("DB_REPLICA_URLS", "").split(",") if url.strip()]
+# Seconds an unreachable replica is skipped before it is tried again.
+REPLICA_RETRY_INTERVAL = float(os.getenv("DB_REPLICA_RETRY_INTERVAL", "30"))
+# Seconds after a successful write during which the same client reads from the primary.
+READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+READ_PRIMARY_COOKIE = "read_primary_until"
+READ_PRIMARY_HEADER = "X-Read-Primary"
+
 engine = create_engine(DATABASE_URL)
+# pool_pre_ping detects replicas that went away while their connections sat in the pool.
+replica_engines = [create_engine(url, pool_pre_ping=True) for url in REPLICA_URLS]
+
+
+class ReplicaRouter:
+    """
+    Hand out read connections round-robin across the replicas.
+
+    A replica that fails to connect is skipped for `retry_interval` seconds;
+    when no replica is usable the primary serves the read instead.
+    """
+
+    def __init__(self, primary, replicas, retry_interval: float = REPLICA_RETRY_INTERVAL):
+        self.primary = primary
+        self.replicas = replicas
+        self.retry_interval = retry_interval
+        self._counter = itertools.count()
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def is_available(self, index: int) -> bool:
+        with self._lock:
+            return self._down_until.get(index, 0.0) <= time.monotonic()
+
+    def mark_down(self, index: int) -> None:
+        with self._lock:
+            self._down_until[index] = time.monotonic() + self.retry_interval
+
+    def connect(self):
+        if self.replicas:
+            start = next(self._counter)
+            for offset in range(len(self.replicas)):
+                index = (start + offset) % len(self.replicas)
+                if not self.is_available(index):
+                    continue
+                try:
+                    return self.replicas[index].connect()
+                except OperationalError as e:
+                    print(f"Read replica {index} is unavailable, retrying in {self.retry_interval}s: {e}")
+                    self.mark_down(index)
+        return self.primary.connect()
+
+
+replica_router = ReplicaRouter(engine, replica_engines)
+
+
+def reads_from_primary(request: Request) -> bool:
+    """True when the client asked for the primary or wrote recently (read-your-writes)."""
+    if request.headers.get(READ_PRIMARY_HEADER, "").lower() in ("1", "true"):
+        return True
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def mark_read_primary(response: Response) -> None:
+    """Send the client's reads to the primary until the replicas have caught up with its write."""
+    until = time.time() + READ_YOUR_WRITES_SECONDS
+    response.set_cookie(READ_PRIMARY_COOKIE, f"{until:.3f}",
+                        max_age=int(READ_YOUR_WRITES_SECONDS) + 1, httponly=True, samesite="lax")
+
+
+def _transaction(conn):
+    if conn.dialect.name == "postgresql":
+        # is_local=true: the setting only lasts until the end of this transaction.
+        conn.execute(text("SELECT set_config('statement_timeout', :timeout, true)"),
+                     {"timeout": str(STATEMENT_TIMEOUT_MS)})
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def get_db():
+    """
+    Provide one connection and one transaction per request.
+
+    Every service function of the request runs on this connection, so a request checks
+    out a single pooled connection and its statements commit or roll back together:
+    the transaction is committed when the endpoint returns and rolled back if it raises
+    (including HTTPException).
+    """
+    with engine.connect() as conn:
+        yield from _transaction(conn)
+
+
+def get_read_db(request: Request):
+    """
+    Like get_db, but for read-only endpoints: the connection comes from a replica
+    chosen by replica_router, unless no replica is configured or the client has
+    just written (see reads_from_primary).
+    """
+    if not replica_engines or reads_from_primary(request):
+        yield from get_db()
+        return
+    with replica_router.connect() as conn:
+        yield from _transaction(conn)
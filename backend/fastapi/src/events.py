@@ -0,0 +1,141 @@
+import asyncio
+import json
+
+from database import engine
+
+# Channel that create_micropost / link_micropost_category publish to with pg_notify.
+EVENTS_CHANNEL = "micropost_events"
+DEFAULT_QUEUE_SIZE = 100
+RECONNECT_DELAY = 5.0  # seconds
+
+
+class EventBroker:
+    """
+    Fan out PostgreSQL notifications to in-process subscribers.
+
+    A single connection, detached from the pool, LISTENs on EVENTS_CHANNEL and is
+    watched by the event loop, so any number of SSE clients costs one database
+    connection. Each subscriber gets its own bounded queue; a subscriber that
+    falls behind is sent None (end of stream) instead of blocking the others.
+    """
+
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self._connection = None
+        self._reconnect_task = None
+
+    @property
+    def available(self) -> bool:
+        return engine.dialect.name == "postgresql"
+
+    async def start(self) -> None:
+        """Open the listener connection."""
+        if not self.available:
+            return
+        try:
+            await self._listen()
+        except Exception as e:
+            print(f"Failed to LISTEN on {EVENTS_CHANNEL}: {e}")
+            self._schedule_reconnect()
+
+    async def stop(self) -> None:
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        self._close()
+        for queue in list(self.subscribers):
+            self._end(queue)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+
+    def publish(self, event: dict) -> None:
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._end(queue)
+
+    def _end(self, queue: asyncio.Queue) -> None:
+        # Make room for the end-of-stream marker so the client reconnects and refetches.
+        self.subscribers.discard(queue)
+        while True:
+            try:
+                queue.put_nowait(None)
+                return
+            except asyncio.QueueFull:
+                queue.get_nowait()
+
+    async def _listen(self) -> None:
+        # Connecting blocks until the connect timeout while the database is down,
+        # so it runs in a worker thread instead of stalling every request on the loop.
+        connection = await asyncio.to_thread(self._connect)
+        self._connection = connection
+        asyncio.get_running_loop().add_reader(connection.fileno(), self._on_readable)
+
+    @staticmethod
+    def _connect():
+        pooled = engine.raw_connection()
+        # The listener lives for the whole process; keep it out of the pool.
+        # driver_connection is None once the pooled connection is detached, so take it first.
+        connection = pooled.driver_connection
+        pooled.detach()
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {EVENTS_CHANNEL}")
+        except Exception:
+            # The pool no longer owns the connection; close it so retries do not leak connections.
+            connection.close()
+            raise
+        return connection
+
+    def _on_readable(self) -> None:
+        try:
+            self._connection.poll()
+        except Exception as e:
+            print(f"Lost the {EVENTS_CHANNEL} listener connection: {e}")
+            self._close()
+            self._schedule_reconnect()
+            return
+        while self._connection.notifies:
+            notify = self._connection.notifies.pop(0)
+            try:
+                self.publish(json.loads(notify.payload))
+            except ValueError:
+                print(f"Ignored malformed notification: {notify.payload!r}")
+
+    def _close(self) -> None:
+        if self._connection is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self._connection.fileno())
+        except Exception:
+            pass
+        try:
+            self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+
+    def _schedule_reconnect(self) -> None:
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        while self._connection is None:
+            await asyncio.sleep(RECONNECT_DELAY)
+            try:
+                await self._listen()
+            except Exception as e:
+                print(f"Failed to LISTEN on {EVENTS_CHANNEL}: {e}")
+                continue
+            # Notifications sent while disconnected are lost; end the streams so clients refetch.
+            for queue in list(self.subscribers):
+                self._end(queue)
@@ -0,0 +1,168 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import click
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+from database import engine
+
+FEATURE_STORE_DIR = os.getenv("FEATURE_STORE_DIR", "feature_store")
+WATERMARK_FILE = "_watermark"
+DEFAULT_BATCH_SIZE = 10_000
+# Ids are assigned when a post is inserted, not when it commits, so a transaction that
+# commits after an extract can leave a post below the watermark. Each extract re-reads
+# posts created within this window before the previous extract and skips the ones
+# already in the store; it must be longer than any transaction that inserts microposts.
+DEFAULT_OVERLAP_MINUTES = 10
+
+FEATURE_SCHEMA = pa.schema([
+    ("micropost_id", pa.int64()),
+    ("user_id", pa.int64()),
+    ("user_name", pa.string()),
+    ("category_ids", pa.list_(pa.int64())),
+    ("content_length", pa.int32()),
+    ("created_at", pa.timestamp("us", tz="UTC")),
+    ("extracted_at", pa.timestamp("us", tz="UTC")),
+])
+
+# One row per micropost with its author and the set of linked categories.
+FEATURE_QUERY = text("""
+    SELECT m.id AS micropost_id,
+           m.user_id,
+           u.name AS user_name,
+           ARRAY(SELECT mc.category_id FROM micropost_categories mc
+                 WHERE mc.micropost_id = m.id ORDER BY mc.category_id) AS category_ids,
+           length(m.content) AS content_length,
+           m.created_at
+    FROM microposts m
+    JOIN users u ON u.id = m.user_id
+    WHERE m.id > :watermark OR m.created_at >= :since
+    ORDER BY m.id
+""")
+
+
+def read_watermark_state(root: str = FEATURE_STORE_DIR) -> tuple:
+    """
+    Return (highest extracted micropost id, time of the last extract).
+    (0, None) when nothing has been extracted; the time is None for watermarks written
+    before it was recorded.
+    """
+    try:
+        with open(os.path.join(root, WATERMARK_FILE)) as f:
+            lines = f.read().split()
+    except FileNotFoundError:
+        return 0, None
+    watermark = int(lines[0]) if lines else 0
+    extracted_at = datetime.fromisoformat(lines[1]) if len(lines) > 1 else None
+    return watermark, extracted_at
+
+
+def read_watermark(root: str = FEATURE_STORE_DIR) -> int:
+    """Return the highest micropost id already extracted (0 when nothing has been extracted)."""
+    return read_watermark_state(root)[0]
+
+
+def write_watermark(watermark: int, extracted_at: datetime, root: str = FEATURE_STORE_DIR) -> None:
+    # Write to a temporary file and rename it so a crash never leaves a truncated watermark.
+    tmp_path = os.path.join(root, f".{WATERMARK_FILE}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(f"{watermark}\n{extracted_at.isoformat()}\n")
+    os.replace(tmp_path, os.path.join(root, WATERMARK_FILE))
+
+
+def extracted_ids_since(root: str, since: datetime) -> set:
+    """Ids of the posts created at or after `since` that are already in the feature store."""
+    table = read_features(root, columns=["micropost_id"], filters=[("created_at", ">=", since)])
+    return set(table.column("micropost_id").to_pylist())
+
+
+def extract_features(root: str = FEATURE_STORE_DIR, batch_size: int = DEFAULT_BATCH_SIZE,
+                     overlap: timedelta = timedelta(minutes=DEFAULT_OVERLAP_MINUTES)) -> int:
+    """
+    Append features for microposts not yet in the feature store.
+
+    Reads the posts above the watermark plus those created within `overlap` before the
+    previous extract, which catches posts whose id was below the watermark but whose
+    transaction had not committed yet; posts already in the store are skipped.
+
+    Rows are streamed from a server-side cursor and written batch by batch into a
+    new Parquet file under a hive-style `extracted_date=YYYY-MM-DD` partition, so
+    memory use is bounded by `batch_size` regardless of table size. The watermark
+    only advances once the file is complete.
+
+    Category links added to a micropost after it was extracted are not picked up.
+
+    :return: Number of microposts extracted.
+    """
+    watermark, last_extracted_at = read_watermark_state(root)
+    extracted_at = datetime.now(timezone.utc)
+    # Without a previous extract time (first run or an old watermark file) only the id watermark applies.
+    since = (last_extracted_at - overlap) if last_extracted_at else extracted_at
+    already_extracted = extracted_ids_since(root, since) if watermark else set()
+    partition_dir = os.path.join(root, f"extracted_date={extracted_at:%Y-%m-%d}")
+    os.makedirs(partition_dir, exist_ok=True)
+    tmp_path = os.path.join(partition_dir, f".part-{watermark + 1}.parquet.tmp")
+
+    rows = 0
+    last_id = watermark
+    writer = None
+    try:
+        with engine.connect() as conn:
+            # yield_per enables stream_results, which makes psycopg2 use a named (server-side) cursor.
+            result = conn.execution_options(yield_per=batch_size).execute(
+                FEATURE_QUERY, {"watermark": watermark, "since": since})
+            for batch in result.mappings().partitions():
+                batch = [row for row in batch if row["micropost_id"] not in already_extracted]
+                if not batch:
+                    continue
+                columns = {name: [row[name] for row in batch] for name in FEATURE_SCHEMA.names[:-1]}
+                columns["extracted_at"] = [extracted_at] * len(batch)
+                table = pa.Table.from_pydict(columns, schema=FEATURE_SCHEMA)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, FEATURE_SCHEMA)
+                writer.write_table(table)
+                rows += len(batch)
+                last_id = max(last_id, columns["micropost_id"][-1])
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if writer is None:
+        write_watermark(watermark, extracted_at, root)
+        return 0
+    writer.close()
+    # The extract time keeps part files unique when a run only adds posts below the watermark.
+    os.replace(tmp_path, os.path.join(partition_dir, f"part-{watermark + 1}-{last_id}-{extracted_at:%H%M%S%f}.parquet"))
+    write_watermark(last_id, extracted_at, root)
+    return rows
+
+
+def read_features(root: str = FEATURE_STORE_DIR, columns: list = None, filters: list = None) -> pa.Table:
+    """
+    Read the feature store as a single Arrow table.
+
+    Files are memory-mapped instead of copied into Python buffers, and `filters`
+    on the `extracted_date` partition column skip whole directories,
+    e.g. `[("extracted_date", ">=", "2025-03-01")]`.
+    """
+    return pq.read_table(root, columns=columns, filters=filters, memory_map=True, partitioning="hive")
+
+
+@click.command()
+@click.option("--root", default=FEATURE_STORE_DIR, show_default=True, help="Feature store directory.")
+@click.option("--batch-size", default=DEFAULT_BATCH_SIZE, show_default=True, help="Rows fetched per round trip.")
+@click.option("--overlap-minutes", default=DEFAULT_OVERLAP_MINUTES, show_default=True,
+              help="Re-read posts created this long before the previous extract.")
+def cli(root, batch_size, overlap_minutes):
+    """Extract micropost features newer than the last watermark into partitioned Parquet."""
+    rows = extract_features(root, batch_size, timedelta(minutes=overlap_minutes))
+    click.echo(f"extracted {rows} microposts (watermark: {read_watermark(root)})")
+
+
+if __name__ == "__main__":
+    cli()
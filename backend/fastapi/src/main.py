@@ -1,7 +1,30 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from routers import router  # ローカル routers.py をインポート
+import services
+from events import EventBroker
+from database import mark_read_primary, replica_engines
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # SQLite（ローカルテスト用）では全文検索用の FTS5 テーブルを作成する
+    services.init_search_index()
+    # 新しい投稿を /microposts/stream の購読者に配信する（PostgreSQL の LISTEN 接続を1本だけ使う）
+    app.state.event_broker = EventBroker()
+    await app.state.event_broker.start()
+    yield
+    await app.state.event_broker.stop()
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    # 書き込みに成功したクライアントの読み取りは、レプリカに反映されるまでプライマリに送る
+    response = await call_next(request)
+    if replica_engines and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        mark_read_primary(response)
+    return response
 
 # 統合したルーターを登録
 app.include_router(router)
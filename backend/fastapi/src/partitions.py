@@ -0,0 +1,166 @@
+import re
+from datetime import date, timedelta
+
+import click
+from sqlalchemy import text
+
+from database import engine
+
+PARTITION_NAME = re.compile(r"^microposts_p(\d{4})(\d{2})$")
+DEFAULT_PARTITION = "microposts_default"
+DEFAULT_MONTHS_AHEAD = 3
+DEFAULT_ARCHIVE_SCHEMA = "archive"
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    # Same naming as the 7c4667af4d09 migration: one partition per UTC month.
+    return f"microposts_p{month:%Y%m}"
+
+
+def list_partitions(conn) -> list:
+    """Return the monthly partitions currently attached to microposts, oldest first."""
+    rows = conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'microposts'::regclass
+    """)).scalars().all()
+    return sorted(name for name in rows if PARTITION_NAME.match(name))
+
+
+def month_bounds(month: date) -> tuple:
+    return f"{month} 00:00:00+00", f"{add_months(month, 1)} 00:00:00+00"
+
+
+def default_partition_has_rows(conn, month: date) -> bool:
+    """True when the default partition holds posts of `month`, which would make CREATE ... PARTITION OF fail."""
+    if conn.execute(text(f"SELECT to_regclass('{DEFAULT_PARTITION}')")).scalar() is None:
+        return False
+    start, end = month_bounds(month)
+    return bool(conn.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end)"
+    ), {"start": start, "end": end}).scalar())
+
+
+def create_partition(conn, month: date) -> None:
+    """
+    Create the partition of `month`, moving any of its posts out of the default partition.
+
+    The default partition is detached and emptied with TRUNCATE rather than DELETE,
+    so the delete_micropost_category_links trigger does not drop the category links
+    of the moved posts; its rows are then re-inserted through the parent and land in
+    the new partition or back in the default one.
+    """
+    name = partition_name(month)
+    start, end = month_bounds(month)
+    create = f"CREATE TABLE {name} PARTITION OF microposts FOR VALUES FROM ('{start}') TO ('{end}')"
+    if not default_partition_has_rows(conn, month):
+        conn.execute(text(create))
+        return
+    conn.execute(text("LOCK TABLE microposts IN ACCESS EXCLUSIVE MODE"))
+    conn.execute(text(f"ALTER TABLE microposts DETACH PARTITION {DEFAULT_PARTITION}"))
+    conn.execute(text(
+        f"CREATE TEMP TABLE default_rows ON COMMIT DROP AS "
+        f"SELECT id, content, user_id, created_at FROM {DEFAULT_PARTITION}"
+    ))
+    conn.execute(text(f"TRUNCATE {DEFAULT_PARTITION}"))
+    conn.execute(text(create))
+    conn.execute(text(f"ALTER TABLE microposts ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    conn.execute(text(
+        "INSERT INTO microposts (id, content, user_id, created_at) "
+        "SELECT id, content, user_id, created_at FROM default_rows"
+    ))
+
+
+def create_future_partitions(months_ahead: int = DEFAULT_MONTHS_AHEAD, today: date = None) -> list:
+    """
+    Create the partitions from the current month up to `months_ahead` months ahead.
+    Run this regularly (e.g. daily from cron) so new posts never land in the default partition;
+    posts that already did are moved into the new partition (see create_partition).
+    """
+    current = month_start(today or date.today())
+    created = []
+    with engine.connect() as conn:
+        existing = set(list_partitions(conn))
+        conn.commit()
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            name = partition_name(month)
+            if name in existing:
+                continue
+            # One transaction per month, so the lock taken when moving rows is held only briefly.
+            with conn.begin():
+                create_partition(conn, month)
+            created.append(name)
+    return created
+
+
+def detach_old_partitions(keep_months: int, archive_schema: str = DEFAULT_ARCHIVE_SCHEMA, today: date = None) -> list:
+    """
+    Detach partitions older than `keep_months` months and move them to `archive_schema`.
+
+    Detached tables keep their rows but are no longer scanned by queries on microposts;
+    dump or drop them from the archive schema when they are no longer needed.
+    DETACH PARTITION CONCURRENTLY is not allowed while the table has a default partition,
+    so this uses a plain DETACH: each partition is detached in its own short transaction,
+    which briefly blocks reads and writes on microposts.
+    """
+    cutoff = add_months(month_start(today or date.today()), -keep_months)
+    detached = []
+    with engine.connect() as conn:
+        with conn.begin():
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}"))
+            names = list_partitions(conn)
+        for name in names:
+            year, month = PARTITION_NAME.match(name).groups()
+            if date(int(year), int(month), 1) >= cutoff:
+                continue
+            with conn.begin():
+                conn.execute(text(f"ALTER TABLE microposts DETACH PARTITION {name}"))
+                conn.execute(text(f"ALTER TABLE {name} SET SCHEMA {archive_schema}"))
+            detached.append(name)
+    return detached
+
+
+@click.group()
+def cli():
+    """Maintain the monthly partitions of the microposts table."""
+
+
+@cli.command()
+@click.option("--months-ahead", default=DEFAULT_MONTHS_AHEAD, show_default=True,
+              help="Number of future months to create partitions for.")
+def create(months_ahead):
+    """Pre-create partitions for the current and upcoming months."""
+    for name in create_future_partitions(months_ahead):
+        click.echo(f"created {name}")
+
+
+@cli.command()
+@click.option("--keep-months", required=True, type=int, help="Number of recent months to keep attached.")
+@click.option("--archive-schema", default=DEFAULT_ARCHIVE_SCHEMA, show_default=True,
+              help="Schema the detached partitions are moved to.")
+def detach(keep_months, archive_schema):
+    """Detach partitions older than --keep-months and move them to the archive schema."""
+    for name in detach_old_partitions(keep_months, archive_schema):
+        click.echo(f"detached {name} -> {archive_schema}.{name}")
+
+
+@cli.command(name="list")
+def list_command():
+    """List the monthly partitions attached to microposts."""
+    with engine.connect() as conn:
+        for name in list_partitions(conn):
+            click.echo(name)
+
+
+if __name__ == "__main__":
+    cli()
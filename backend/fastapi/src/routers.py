@@ -1,5 +1,14 @@
-from fastapi import APIRouter
+import asyncio
+import json
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import Connection
+
+from database import get_db, get_read_db
 import services
 
 # Input schema definitions
@@ -17,60 +26,116 @@ class MicropostCategoryLinkInput(BaseModel):
     micropost_id: int
     category_id: int
 
+# Endpoints are plain `def` so FastAPI runs their blocking database calls in its threadpool
+# instead of on the event loop; each request gets its own connection/transaction from get_db.
 router = APIRouter()
 
 # --- Categories Endpoints ---
 @router.post("/categories")
-async def create_category(data: CategoryInput):
-    return services.create_category(data.name)
+def create_category(data: CategoryInput, conn: Connection = Depends(get_db)):
+    return services.create_category(conn, data.name)
 
 @router.get("/categories")
-async def list_categories():
-    return services.list_categories()
+def list_categories(conn: Connection = Depends(get_read_db)):
+    return services.list_categories(conn)
+
+# Declared before /categories/{category_id} so "stats" is not parsed as an id.
+@router.get("/categories/stats")
+def list_category_stats(conn: Connection = Depends(get_read_db)):
+    return services.list_category_stats(conn)
+
+@router.post("/categories/stats/refresh")
+def refresh_category_stats(conn: Connection = Depends(get_db)):
+    return services.refresh_category_stats(conn)
 
 @router.get("/categories/{category_id}")
-async def get_category(category_id: int):
-    return services.get_category(category_id)
+def get_category(category_id: int, conn: Connection = Depends(get_read_db)):
+    return services.get_category(conn, category_id)
 
 # --- Users Endpoints ---
 @router.post("/users")
-async def create_user(data: UserInput):
-    return services.create_user(data.name)
+def create_user(data: UserInput, conn: Connection = Depends(get_db)):
+    return services.create_user(conn, data.name)
 
 @router.get("/users")
-async def list_users():
-    return services.list_users()
+def list_users(conn: Connection = Depends(get_read_db)):
+    return services.list_users(conn)
 
 @router.get("/users/{user_id}")
-async def get_user(user_id: int):
-    return services.get_user(user_id)
+def get_user(user_id: int, conn: Connection = Depends(get_read_db)):
+    return services.get_user(conn, user_id)
 
 # --- Microposts Endpoints ---
 @router.post("/microposts")
-async def create_micropost(data: MicropostInput):
-    return services.create_micropost(data.content, data.user_id)
+def create_micropost(data: MicropostInput, conn: Connection = Depends(get_db)):
+    return services.create_micropost(conn, data.content, data.user_id)
 
 @router.get("/microposts")
-async def list_microposts():
-    return services.list_microposts()
+def list_microposts(since: Optional[datetime] = None, conn: Connection = Depends(get_read_db)):
+    return services.list_microposts(conn, since)
+
+# Seconds between SSE comment lines that keep idle connections (and proxies) alive.
+STREAM_HEARTBEAT_INTERVAL = 15
+# Milliseconds the browser waits before reconnecting after the stream ends.
+STREAM_RETRY_MS = 3000
+
+# Declared before /microposts/{micropost_id} so "stream" is not parsed as an id.
+@router.get("/microposts/stream")
+async def stream_microposts(request: Request):
+    """
+    Server-Sent Events stream of new microposts ("micropost") and category links ("category_link").
+    When the stream ends (server restart, slow client), reconnect and refetch to catch up.
+    """
+    broker = request.app.state.event_broker
+    if not broker.available:
+        raise HTTPException(status_code=503, detail="Live stream requires PostgreSQL")
+
+    async def events():
+        queue = broker.subscribe()
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is None:
+                    break
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            broker.unsubscribe(queue)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+# Declared before /microposts/{micropost_id} so "search" is not parsed as an id.
+@router.get("/microposts/search")
+def search_microposts(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    conn: Connection = Depends(get_read_db),
+):
+    return services.search_microposts(conn, q, limit, offset)
 
 @router.get("/microposts/{micropost_id}")
-async def get_micropost(micropost_id: int):
-    return services.get_micropost(micropost_id)
+def get_micropost(micropost_id: int, conn: Connection = Depends(get_read_db)):
+    return services.get_micropost(conn, micropost_id)
 
 # --- Micropost-Categories Endpoints ---
 @router.post("/micropost-categories")
-async def link_micropost_category(data: MicropostCategoryLinkInput):
-    return services.link_micropost_category(data.micropost_id, data.category_id)
+def link_micropost_category(data: MicropostCategoryLinkInput, conn: Connection = Depends(get_db)):
+    return services.link_micropost_category(conn, data.micropost_id, data.category_id)
 
 @router.get("/micropost-categories")
-async def list_micropost_category_links():
-    return services.list_micropost_category_links()
+def list_micropost_category_links(conn: Connection = Depends(get_read_db)):
+    return services.list_micropost_category_links(conn)
 
 @router.get("/micropost-categories/micropost/{micropost_id}")
-async def get_categories_for_micropost(micropost_id: int):
-    return services.get_categories_for_micropost(micropost_id)
+def get_categories_for_micropost(micropost_id: int, conn: Connection = Depends(get_read_db)):
+    return services.get_categories_for_micropost(conn, micropost_id)
 
 @router.get("/micropost-categories/category/{category_id}")
-async def get_microposts_for_category(category_id: int):
-    return services.get_microposts_for_category(category_id) 
\ No newline at end of file
+def get_microposts_for_category(category_id: int, conn: Connection = Depends(get_read_db)):
+    return services.get_microposts_for_category(conn, category_id) 
\ No newline at end of file
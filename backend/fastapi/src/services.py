@@ -1,144 +1,319 @@
+from datetime import datetime
+
 from fastapi import HTTPException
-from sqlalchemy import text
+from sqlalchemy import Connection, text
 from database import engine
+from events import EVENTS_CHANNEL
+
+# NOTIFY payloads are limited to 8000 bytes; larger rows are announced by id only.
+NOTIFY_PAYLOAD_LIMIT = 7000
 
 # --- 共通のヘルパー関数 ---
-def execute_db_query(query: text, params: dict = None, commit: bool = False, fetch: str = "none"):
+def execute_db_query(conn: Connection, query: text, params: dict = None, fetch: str = "none"):
     """
-    Execute a SQL query, optionally commit, and fetch results.
+    Execute a SQL query on the request's connection and fetch results.
+    The transaction is committed or rolled back once per request by database.get_db.
     
+    :param conn: Connection of the current request (from database.get_db).
     :param query: SQL query string.
     :param params: Dictionary of parameters for the query.
-    :param commit: Whether to commit the transaction.
     :param fetch: 'one' for single record, 'all' for all records, 'none' for no fetch.
     :return: Fetched result(s) if applicable.
     """
-    with engine.connect() as conn:
-        result = conn.execute(query, params or {})
-        data = None
-        if fetch == "one":
-            data = result.fetchone()
-        elif fetch == "all":
-            data = result.fetchall()
-        if commit:
-            conn.commit()
+    result = conn.execute(query, params or {})
+    data = None
+    if fetch == "one":
+        data = result.fetchone()
+    elif fetch == "all":
+        data = result.fetchall()
     return data
 
+def notify_from(relation: str, event_type: str) -> str:
+    """
+    Build a FROM-clause item (PostgreSQL only) that publishes every row of `relation` (a CTE) on EVENTS_CHANNEL.
+    The notification is delivered to /microposts/stream subscribers when the statement commits.
+    """
+    return f"""
+        , LATERAL pg_notify('{EVENTS_CHANNEL}', CASE
+            WHEN octet_length(row_to_json({relation})::text) < {NOTIFY_PAYLOAD_LIMIT}
+                THEN json_build_object('type', '{event_type}', 'data', row_to_json({relation}))::text
+            ELSE json_build_object('type', '{event_type}', 'data', json_build_object('id', {relation}.id), 'truncated', true)::text
+        END)
+    """
+
 # --- Category Functions ---
-def create_category(name: str):
+def create_category(conn: Connection, name: str):
     # Insert a new category and return the created record.
     query = text("INSERT INTO categories (name) VALUES (:name) RETURNING *")
-    category = execute_db_query(query, {"name": name}, commit=True, fetch="one")
+    category = execute_db_query(conn, query, {"name": name}, fetch="one")
     if category is None:
         raise HTTPException(status_code=500, detail="Category creation failed")
     return dict(category._mapping)
 
-def list_categories():
+def list_categories(conn: Connection):
     # Retrieve all categories.
     query = text("SELECT * FROM categories")
-    categories = execute_db_query(query, fetch="all")
+    categories = execute_db_query(conn, query, fetch="all")
     return [dict(category._mapping) for category in categories]
 
-def get_category(category_id: int):
+def get_category(conn: Connection, category_id: int):
     # Retrieve a category by its id.
     query = text("SELECT * FROM categories WHERE id = :id")
-    category = execute_db_query(query, {"id": category_id}, fetch="one")
+    category = execute_db_query(conn, query, {"id": category_id}, fetch="one")
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     return dict(category._mapping)
 
+def list_category_stats(conn: Connection):
+    # Retrieve the post count and latest micropost of every category from the counter table.
+    query = text("""
+        SELECT c.id AS category_id, c.name,
+               COALESCE(s.post_count, 0) AS post_count, s.latest_micropost_id, s.latest_created_at, s.updated_at
+        FROM categories c
+        LEFT JOIN category_stats s ON s.category_id = c.id
+        ORDER BY c.id
+    """)
+    stats = execute_db_query(conn, query, fetch="all")
+    return [dict(stat._mapping) for stat in stats]
+
+def refresh_category_stats(conn: Connection):
+    """
+    Recompute every category's counters from micropost_categories in bulk.
+    Use this after links are removed outside link_micropost_category (e.g. cascading deletes).
+    """
+    query = text("""
+        INSERT INTO category_stats (category_id, post_count, latest_micropost_id, latest_created_at, updated_at)
+        SELECT c.id, count(mc.micropost_id), max(mc.micropost_id), max(m.created_at), CURRENT_TIMESTAMP
+        FROM categories c
+        LEFT JOIN micropost_categories mc ON mc.category_id = c.id
+        LEFT JOIN microposts m ON m.id = mc.micropost_id
+        GROUP BY c.id
+        ON CONFLICT (category_id) DO UPDATE SET
+            post_count = EXCLUDED.post_count,
+            latest_micropost_id = EXCLUDED.latest_micropost_id,
+            latest_created_at = EXCLUDED.latest_created_at,
+            updated_at = EXCLUDED.updated_at
+        RETURNING *
+    """)
+    stats = execute_db_query(conn, query, fetch="all")
+    return [dict(stat._mapping) for stat in stats]
+
 # --- User Functions ---
-def create_user(name: str):
+def create_user(conn: Connection, name: str):
     # Insert a new user and return the created record.
     query = text("INSERT INTO users (name) VALUES (:name) RETURNING *")
-    user = execute_db_query(query, {"name": name}, commit=True, fetch="one")
+    user = execute_db_query(conn, query, {"name": name}, fetch="one")
     if user is None:
         raise HTTPException(status_code=500, detail="User creation failed")
     return dict(user._mapping)
 
-def list_users():
+def list_users(conn: Connection):
     # Retrieve all users.
     query = text("SELECT * FROM users")
-    users = execute_db_query(query, fetch="all")
+    users = execute_db_query(conn, query, fetch="all")
     return [dict(user._mapping) for user in users]
 
-def get_user(user_id: int):
+def get_user(conn: Connection, user_id: int):
     # Retrieve a user by its id.
     query = text("SELECT * FROM users WHERE id = :id")
-    user = execute_db_query(query, {"id": user_id}, fetch="one")
+    user = execute_db_query(conn, query, {"id": user_id}, fetch="one")
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return dict(user._mapping)
 
 # --- Micropost Functions ---
-def create_micropost(content: str, user_id: int):
+def create_micropost(conn: Connection, content: str, user_id: int):
     # Insert a new micropost and associate it with a user.
-    query = text("INSERT INTO microposts (content, user_id) VALUES (:content, :user_id) RETURNING *")
-    micropost = execute_db_query(query, {"content": content, "user_id": user_id}, commit=True, fetch="one")
+    insert = "INSERT INTO microposts (content, user_id) VALUES (:content, :user_id) RETURNING *"
+    if engine.dialect.name == "postgresql":
+        # Announce the new micropost to stream subscribers in the same statement.
+        query = text(f"WITH micropost AS ({insert}) SELECT micropost.* FROM micropost {notify_from('micropost', 'micropost')}")
+    else:
+        query = text(insert)
+    micropost = execute_db_query(conn, query, {"content": content, "user_id": user_id}, fetch="one")
     if micropost is None:
         raise HTTPException(status_code=500, detail="Micropost creation failed")
     return dict(micropost._mapping)
 
-def list_microposts():
-    # Retrieve all microposts.
-    query = text("SELECT * FROM microposts")
-    microposts = execute_db_query(query, fetch="all")
+def list_microposts(conn: Connection, since: datetime = None):
+    # Retrieve all microposts, or only those created at or after `since` (newest first).
+    # Filtering on created_at lets PostgreSQL skip older partitions when microposts is partitioned.
+    if since is None:
+        query = text("SELECT * FROM microposts")
+        params = {}
+    else:
+        query = text("SELECT * FROM microposts WHERE created_at >= :since ORDER BY created_at DESC, id DESC")
+        params = {"since": since}
+    microposts = execute_db_query(conn, query, params, fetch="all")
+    return [dict(micropost._mapping) for micropost in microposts]
+
+def init_search_index():
+    """
+    Create the SQLite FTS5 index used by search_microposts when running against SQLite for local testing.
+    On PostgreSQL the GIN index on to_tsvector('simple', content) is created by the schema DDL instead.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'microposts_fts'")).fetchone()
+        if exists:
+            return
+        # External content table: the index stores only tokens, triggers keep it in sync with microposts.
+        conn.execute(text("""
+            CREATE VIRTUAL TABLE microposts_fts USING fts5(content, content='microposts', content_rowid='id', tokenize='trigram')
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER microposts_fts_insert AFTER INSERT ON microposts BEGIN
+                INSERT INTO microposts_fts (rowid, content) VALUES (new.id, new.content);
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER microposts_fts_delete AFTER DELETE ON microposts BEGIN
+                INSERT INTO microposts_fts (microposts_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER microposts_fts_update AFTER UPDATE ON microposts BEGIN
+                INSERT INTO microposts_fts (microposts_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO microposts_fts (rowid, content) VALUES (new.id, new.content);
+            END
+        """))
+        # Index the rows that existed before the table was created.
+        conn.execute(text("INSERT INTO microposts_fts (microposts_fts) VALUES ('rebuild')"))
+
+def search_microposts(conn: Connection, q: str, limit: int, offset: int):
+    # Retrieve microposts whose content matches the query, best matches first.
+    params = {"q": q, "limit": limit, "offset": offset}
+    if engine.dialect.name == "sqlite":
+        if len(q) < 3:
+            # The trigram tokenizer cannot match terms shorter than 3 characters.
+            query = text("""
+                SELECT *, 0.0 AS rank FROM microposts WHERE content LIKE :pattern
+                ORDER BY id DESC LIMIT :limit OFFSET :offset
+            """)
+            params["pattern"] = f"%{q}%"
+        else:
+            query = text("""
+                SELECT m.*, -bm25(microposts_fts) AS rank
+                FROM microposts_fts JOIN microposts m ON m.id = microposts_fts.rowid
+                WHERE microposts_fts MATCH :q
+                ORDER BY rank DESC, m.id DESC LIMIT :limit OFFSET :offset
+            """)
+            # Quote the whole query as a phrase so FTS5 operators in user input are not interpreted.
+            params["q"] = '"' + q.replace('"', '""') + '"'
+    else:
+        query = text("""
+            SELECT m.*, ts_rank(to_tsvector('simple', m.content), tsq) AS rank
+            FROM microposts m, websearch_to_tsquery('simple', :q) tsq
+            WHERE to_tsvector('simple', m.content) @@ tsq
+            ORDER BY rank DESC, m.id DESC LIMIT :limit OFFSET :offset
+        """)
+    microposts = execute_db_query(conn, query, params, fetch="all")
     return [dict(micropost._mapping) for micropost in microposts]
 
-def get_micropost(micropost_id: int):
+def get_micropost(conn: Connection, micropost_id: int):
     # Retrieve a micropost by its id.
     query = text("SELECT * FROM microposts WHERE id = :id")
-    micropost = execute_db_query(query, {"id": micropost_id}, fetch="one")
+    micropost = execute_db_query(conn, query, {"id": micropost_id}, fetch="one")
     if not micropost:
         raise HTTPException(status_code=404, detail="Micropost not found")
     return dict(micropost._mapping)
 
 # --- Micropost-Category Link Functions ---
-def link_micropost_category(micropost_id: int, category_id: int):
+def link_micropost_category(conn: Connection, micropost_id: int, category_id: int):
     """
     Verify the existence of both micropost and category, then create a link record.
+    All statements run in the request's transaction; FOR KEY SHARE keeps both rows from being
+    deleted before the link commits (microposts has no foreign key to rely on once partitioned).
     """
+    postgresql = engine.dialect.name == "postgresql"
+    # FOR KEY SHARE is PostgreSQL only; SQLite (local testing) serializes writers with a database lock instead.
+    lock = " FOR KEY SHARE" if postgresql else ""
+
     # Verify if the specified category exists.
-    query_category = text("SELECT * FROM categories WHERE id = :id")
-    category = execute_db_query(query_category, {"id": category_id}, fetch="one")
+    query_category = text(f"SELECT * FROM categories WHERE id = :id{lock}")
+    category = execute_db_query(conn, query_category, {"id": category_id}, fetch="one")
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
 
     # Verify if the specified micropost exists.
-    query_micropost = text("SELECT * FROM microposts WHERE id = :id")
-    micropost = execute_db_query(query_micropost, {"id": micropost_id}, fetch="one")
+    query_micropost = text(f"SELECT * FROM microposts WHERE id = :id{lock}")
+    micropost = execute_db_query(conn, query_micropost, {"id": micropost_id}, fetch="one")
     if not micropost:
         raise HTTPException(status_code=404, detail="Micropost not found")
 
-    # Create link between micropost and category.
-    query_link = text("INSERT INTO micropost_categories (micropost_id, category_id) VALUES (:micropost_id, :category_id) RETURNING *")
-    link = execute_db_query(query_link, {"micropost_id": micropost_id, "category_id": category_id}, commit=True, fetch="one")
+    params = {"micropost_id": micropost_id, "category_id": category_id, "created_at": micropost._mapping["created_at"]}
+    if postgresql:
+        # Create link between micropost and category, bump the category's counters and announce the link
+        # to stream subscribers in the same statement.
+        query_link = text(f"""
+            WITH link AS (
+                INSERT INTO micropost_categories (micropost_id, category_id)
+                VALUES (:micropost_id, :category_id)
+                ON CONFLICT (micropost_id, category_id) DO NOTHING
+                RETURNING *
+            ), stats AS (
+                INSERT INTO category_stats (category_id, post_count, latest_micropost_id, latest_created_at, updated_at)
+                SELECT category_id, 1, micropost_id, CAST(:created_at AS timestamptz), now() FROM link
+                ON CONFLICT (category_id) DO UPDATE SET
+                    post_count = category_stats.post_count + 1,
+                    latest_micropost_id = GREATEST(category_stats.latest_micropost_id, EXCLUDED.latest_micropost_id),
+                    latest_created_at = GREATEST(category_stats.latest_created_at, EXCLUDED.latest_created_at),
+                    updated_at = EXCLUDED.updated_at
+            )
+            SELECT link.* FROM link {notify_from("link", "category_link")}
+        """)
+        link = execute_db_query(conn, query_link, params, fetch="one")
+    else:
+        # SQLite has no data-modifying CTEs: insert the link, then bump the counters in the same transaction.
+        query_link = text("""
+            INSERT INTO micropost_categories (micropost_id, category_id)
+            VALUES (:micropost_id, :category_id)
+            ON CONFLICT (micropost_id, category_id) DO NOTHING
+            RETURNING *
+        """)
+        link = execute_db_query(conn, query_link, params, fetch="one")
+        if link is not None:
+            # SQLite's scalar max() returns NULL if any argument is NULL, so fall back to the new value.
+            query_stats = text("""
+                INSERT INTO category_stats (category_id, post_count, latest_micropost_id, latest_created_at, updated_at)
+                VALUES (:category_id, 1, :micropost_id, :created_at, CURRENT_TIMESTAMP)
+                ON CONFLICT (category_id) DO UPDATE SET
+                    post_count = category_stats.post_count + 1,
+                    latest_micropost_id = max(coalesce(category_stats.latest_micropost_id, excluded.latest_micropost_id),
+                                              excluded.latest_micropost_id),
+                    latest_created_at = max(coalesce(category_stats.latest_created_at, excluded.latest_created_at),
+                                            excluded.latest_created_at),
+                    updated_at = excluded.updated_at
+            """)
+            execute_db_query(conn, query_stats, params)
     if link is None:
-        raise HTTPException(status_code=500, detail="Link creation failed")
+        # The unique (micropost_id, category_id) constraint rejected a duplicate; counters were not touched.
+        raise HTTPException(status_code=409, detail="Micropost is already linked to this category")
     return dict(link._mapping)
 
-def list_micropost_category_links():
+def list_micropost_category_links(conn: Connection):
     # Retrieve all micropost-category links.
     query = text("SELECT * FROM micropost_categories")
-    links = execute_db_query(query, fetch="all")
+    links = execute_db_query(conn, query, fetch="all")
     return [dict(link._mapping) for link in links]
 
-def get_categories_for_micropost(micropost_id: int):
+def get_categories_for_micropost(conn: Connection, micropost_id: int):
     # Retrieve all categories associated with a specified micropost.
     query = text("""
         SELECT c.* FROM categories c 
         JOIN micropost_categories mc ON c.id = mc.category_id 
         WHERE mc.micropost_id = :micropost_id
     """)
-    categories = execute_db_query(query, {"micropost_id": micropost_id}, fetch="all")
+    categories = execute_db_query(conn, query, {"micropost_id": micropost_id}, fetch="all")
     return [dict(category._mapping) for category in categories]
 
-def get_microposts_for_category(category_id: int):
+def get_microposts_for_category(conn: Connection, category_id: int):
     # Retrieve all microposts associated with a specified category.
     query = text("""
         SELECT m.* FROM microposts m 
         JOIN micropost_categories mc ON m.id = mc.micropost_id 
         WHERE mc.category_id = :category_id
     """)
-    microposts = execute_db_query(query, {"category_id": category_id}, fetch="all")
+    microposts = execute_db_query(conn, query, {"category_id": category_id}, fetch="all")
     return [dict(micropost._mapping) for micropost in microposts]
@@ -0,0 +1,8 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# database.py requires DB_URL. Without a PostgreSQL server the tests run against an in-memory SQLite
+# database (the local testing mode); PostgreSQL-only tests are skipped.
+os.environ.setdefault("DB_URL", "sqlite://")
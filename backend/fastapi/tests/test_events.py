@@ -0,0 +1,109 @@
+import asyncio
+import json
+import socket
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+
+import events
+from database import engine
+from events import EVENTS_CHANNEL, EventBroker
+
+
+class FakeDriverConnection:
+    """Stands in for a psycopg2 connection: NOTIFYs are queued and the socket becomes readable."""
+
+    def __init__(self):
+        self._reader, self._writer = socket.socketpair()
+        self._pending = []
+        self.notifies = []
+        self.autocommit = False
+        self.executed = []
+        self.closed = False
+
+    def fileno(self):
+        return self._reader.fileno()
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql):
+                connection.executed.append(sql)
+
+        return Cursor()
+
+    def notify(self, payload: str) -> None:
+        self._pending.append(SimpleNamespace(channel=EVENTS_CHANNEL, payload=payload))
+        self._writer.send(b"x")
+
+    def poll(self):
+        self._reader.recv(1024)
+        self.notifies.extend(self._pending)
+        self._pending.clear()
+
+    def close(self):
+        self.closed = True
+        self._reader.close()
+        self._writer.close()
+
+
+class FakePooledConnection:
+    """Like SQLAlchemy's pooled connection, driver_connection is None once detached."""
+
+    def __init__(self, driver_connection):
+        self._driver_connection = driver_connection
+        self.detached = False
+
+    @property
+    def driver_connection(self):
+        return None if self.detached else self._driver_connection
+
+    def detach(self):
+        self.detached = True
+
+
+@pytest.mark.asyncio
+async def test_notify_reaches_subscriber(monkeypatch):
+    driver_connection = FakeDriverConnection()
+    pooled = FakePooledConnection(driver_connection)
+    monkeypatch.setattr(events, "engine", SimpleNamespace(
+        dialect=SimpleNamespace(name="postgresql"), raw_connection=lambda: pooled,
+    ))
+    broker = EventBroker()
+    await broker.start()
+    try:
+        assert pooled.detached
+        assert driver_connection.autocommit
+        assert driver_connection.executed == [f"LISTEN {EVENTS_CHANNEL}"]
+
+        queue = broker.subscribe()
+        driver_connection.notify(json.dumps({"type": "micropost", "data": {"id": 1}}))
+        assert await asyncio.wait_for(queue.get(), 1) == {"type": "micropost", "data": {"id": 1}}
+    finally:
+        await broker.stop()
+    assert driver_connection.closed
+    assert broker._reconnect_task is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(engine.dialect.name != "postgresql", reason="LISTEN/NOTIFY requires PostgreSQL (DB_URL)")
+async def test_notify_reaches_subscriber_on_postgres():
+    broker = EventBroker()
+    await broker.start()
+    try:
+        assert broker._connection is not None
+        queue = broker.subscribe()
+        with engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                         {"channel": EVENTS_CHANNEL, "payload": json.dumps({"type": "micropost", "data": {"id": 1}})})
+        assert await asyncio.wait_for(queue.get(), 5) == {"type": "micropost", "data": {"id": 1}}
+    finally:
+        await broker.stop()
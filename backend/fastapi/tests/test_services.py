@@ -0,0 +1,69 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+
+import services
+from database import engine
+
+# SQLite equivalent of the README DDL, for the local testing mode.
+SQLITE_DDL = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT NOT NULL)",
+    """CREATE TABLE microposts (
+        id INTEGER PRIMARY KEY, content TEXT NOT NULL, user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )""",
+    "CREATE TABLE categories (id INTEGER PRIMARY KEY, name TEXT NOT NULL)",
+    """CREATE TABLE micropost_categories (
+        id INTEGER PRIMARY KEY,
+        micropost_id INTEGER NOT NULL REFERENCES microposts(id) ON DELETE CASCADE,
+        category_id INTEGER NOT NULL REFERENCES categories(id) ON DELETE CASCADE,
+        UNIQUE (micropost_id, category_id)
+    )""",
+    """CREATE TABLE category_stats (
+        category_id INTEGER PRIMARY KEY REFERENCES categories(id) ON DELETE CASCADE,
+        post_count INTEGER NOT NULL DEFAULT 0,
+        latest_micropost_id INTEGER,
+        latest_created_at TEXT,
+        updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )""",
+]
+
+
+@pytest.fixture
+def conn():
+    if engine.dialect.name != "sqlite":
+        pytest.skip("runs against the SQLite local testing mode")
+    with engine.connect() as conn:
+        for ddl in SQLITE_DDL:
+            conn.execute(text(ddl))
+        yield conn
+        conn.rollback()
+        for table in ["category_stats", "micropost_categories", "categories", "microposts", "users"]:
+            conn.execute(text(f"DROP TABLE {table}"))
+        conn.commit()
+
+
+def test_link_micropost_category_on_sqlite(conn):
+    user = services.create_user(conn, "alice")
+    category = services.create_category(conn, "news")
+    first = services.create_micropost(conn, "first", user["id"])
+    second = services.create_micropost(conn, "second", user["id"])
+
+    services.link_micropost_category(conn, second["id"], category["id"])
+    services.link_micropost_category(conn, first["id"], category["id"])
+    with pytest.raises(HTTPException) as e:
+        services.link_micropost_category(conn, first["id"], category["id"])
+    assert e.value.status_code == 409
+    with pytest.raises(HTTPException) as e:
+        services.link_micropost_category(conn, first["id"], category["id"] + 1)
+    assert e.value.status_code == 404
+
+    [stats] = services.list_category_stats(conn)
+    assert stats["post_count"] == 2
+    # Linking an older post later does not move the latest post back.
+    assert stats["latest_micropost_id"] == second["id"]
+    assert stats["latest_created_at"] == second["created_at"]
+
+    [refreshed] = services.refresh_category_stats(conn)
+    assert refreshed["post_count"] == 2
+    assert refreshed["latest_micropost_id"] == second["id"]
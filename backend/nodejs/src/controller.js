@@ -2,11 +2,25 @@ const micropostService = require('./service');
 
 /**
  * GET /api/v1/microposts
- * Retrieve all microposts.
+ * Retrieve all microposts, or one page of them when 'offset'/'limit' are given.
+ * With 'since_id', only microposts newer than that id are returned (oldest first).
+ * 'title' filters by a title substring; 'sort' ('id' | 'title') and 'order' ('asc' | 'desc') sort the result.
+ * The total number of matching microposts is returned in the X-Total-Count header.
  */
 function getAllMicroposts(req, res) {
-  const microposts = micropostService.getAllMicroposts();
-  res.json(microposts);
+  const offset = Math.max(parseInt(req.query.offset, 10) || 0, 0);
+  const limit = parseInt(req.query.limit, 10);
+  const sinceId = parseInt(req.query.since_id, 10);
+  const { items, total } = micropostService.getMicropostsPage({
+    offset,
+    limit: Number.isNaN(limit) ? undefined : Math.max(limit, 0),
+    sinceId: Number.isNaN(sinceId) ? undefined : sinceId,
+    title: req.query.title,
+    sort: req.query.sort,
+    order: req.query.order,
+  });
+  res.set('X-Total-Count', String(total));
+  res.json(items);
 }
 
 /**
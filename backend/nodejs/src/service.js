@@ -40,6 +40,35 @@ function getAllMicroposts() {
   return db.microposts;
 }
 
+/**
+ * Retrieve one page of microposts together with the total count.
+ * Options:
+ *  - offset / limit: page window (every micropost from offset onward when limit is omitted)
+ *  - sinceId: only microposts with a greater id (oldest first unless sort is given)
+ *  - title: case-insensitive substring filter on title
+ *  - sort / order: sort column ('id' or 'title') and direction ('asc' or 'desc')
+ */
+function getMicropostsPage({ offset = 0, limit, sinceId, title, sort, order = 'asc' } = {}) {
+  let microposts = getAllMicroposts();
+  if (sinceId !== undefined) {
+    microposts = microposts.filter(mp => mp.id > sinceId).sort((a, b) => a.id - b.id);
+  }
+  if (title) {
+    const keyword = title.toLowerCase();
+    microposts = microposts.filter(mp => String(mp.title).toLowerCase().includes(keyword));
+  }
+  if (sort === 'id' || sort === 'title') {
+    const direction = order === 'desc' ? -1 : 1;
+    microposts = [...microposts].sort((a, b) => {
+      if (a[sort] < b[sort]) return -direction;
+      if (a[sort] > b[sort]) return direction;
+      return 0;
+    });
+  }
+  const end = limit === undefined ? undefined : offset + limit;
+  return { items: microposts.slice(offset, end), total: microposts.length };
+}
+
 /**
  * Retrieve a micropost by its id.
  */
@@ -93,6 +122,7 @@ function deleteMicropost(id) {
 
 module.exports = {
   getAllMicroposts,
+  getMicropostsPage,
   getMicropostById,
   createMicropost,
   updateMicropost,
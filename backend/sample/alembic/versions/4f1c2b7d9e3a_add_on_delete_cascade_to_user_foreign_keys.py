@@ -0,0 +1,43 @@
+"""add on delete cascade to user foreign keys
+
+Revision ID: 4f1c2b7d9e3a
+Revises: 906ffd5a0ff5
+Create Date: 2026-10-19 19:12:40.418305
+
+ユーザーを削除したときに items と user_roles の行をデータベース側で削除する。
+アプリケーションはアイテムを読み込まずに users の行を1回の DELETE で削除できる。
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f1c2b7d9e3a'
+down_revision = '906ffd5a0ff5'
+branch_labels = None
+depends_on = None
+
+# (テーブル, 作成する外部キー名)
+USER_FOREIGN_KEYS = [
+    ('items', 'items_user_id_fkey'),
+    ('user_roles', 'user_roles_user_id_fkey'),
+]
+
+
+def drop_user_foreign_key(table: str) -> None:
+    # 初期テーブルの外部キーは名前を付けずに作成しているため、データベースが付けた名前を調べて削除する
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys(table):
+        if fk['referred_table'] == 'users' and fk['constrained_columns'] == ['user_id']:
+            op.drop_constraint(fk['name'], table, type_='foreignkey')
+
+
+def upgrade() -> None:
+    for table, name in USER_FOREIGN_KEYS:
+        drop_user_foreign_key(table)
+        op.create_foreign_key(name, table, 'users', ['user_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    for table, name in USER_FOREIGN_KEYS:
+        drop_user_foreign_key(table)
+        op.create_foreign_key(name, table, 'users', ['user_id'], ['id'])
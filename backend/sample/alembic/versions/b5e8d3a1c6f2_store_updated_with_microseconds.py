@@ -0,0 +1,37 @@
+"""store updated with microseconds
+
+Revision ID: b5e8d3a1c6f2
+Revises: 4f1c2b7d9e3a
+Create Date: 2026-10-19 21:05:13.572940
+
+users.updated / items.updated は ETag / Last-Modified に使うため、同じ秒の更新も区別できるよう
+MySQL ではマイクロ秒まで保存する DATETIME(6) にする（他のデータベースは元からマイクロ秒まで保存する）。
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e8d3a1c6f2'
+down_revision = '4f1c2b7d9e3a'
+branch_labels = None
+depends_on = None
+
+TABLES = ['users', 'items']
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    for table in TABLES:
+        op.alter_column(table, 'updated', type_=mysql.DATETIME(fsp=6),
+                        existing_type=sa.DateTime(), existing_nullable=False)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    for table in TABLES:
+        op.alter_column(table, 'updated', type_=sa.DateTime(),
+                        existing_type=mysql.DATETIME(fsp=6), existing_nullable=False)
@@ -3,7 +3,7 @@ from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from jose import jwt, JWTError
-from session import get_session
+from session import get_read_session, get_session
 from model import User
 from env import Environment
 from typing import List, Callable
@@ -26,8 +26,17 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/token")
 
 def get_current_user(permissions: List[PermissionType] = []) -> Callable:
+    return _current_user_dependency(permissions, get_session)
+
+def get_current_read_user(permissions: List[PermissionType] = []) -> Callable:
+    """読み取り用のエンドポイントで使う get_current_user
+    ユーザーの取得もエンドポイントと同じ読み取り用のセッション（レプリカ）で行い、プライマリに接続しない
+    """
+    return _current_user_dependency(permissions, get_read_session)
+
+def _current_user_dependency(permissions: List[PermissionType], session_dependency: Callable) -> Callable:
     def _get_current_user(
-        session: Session = Depends(get_session),
+        session: Session = Depends(session_dependency),
         token: str = Depends(oauth2_scheme),
     ) -> User:
         """JWTの署名検証を行い、subに格納されているusernameからUserオブジェクトを取得する
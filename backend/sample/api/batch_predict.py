@@ -0,0 +1,123 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from inference import OnnxModel
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+# ワーカープロセスごとに1回だけ読み込むモデル
+_worker_model: Optional[OnnxModel] = None
+
+
+def _is_parquet(path: str) -> bool:
+    return path.endswith((".parquet", ".pq"))
+
+
+def iter_chunks(path: str, chunk_size: int, columns: Optional[List[str]] = None) -> Iterator[np.ndarray]:
+    """CSV/Parquetファイルを chunk_size 行ずつ float32 の2次元配列として読み込む
+    columns を指定した場合、列はファイル内の順番ではなく columns の順番に並べる
+    （usecols / columns はファイル内の順番で返すため、並べ替えないと特徴量の順番がずれる）
+    """
+    if _is_parquet(path):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            if columns is not None:
+                batch = batch.select(columns)
+            yield np.column_stack([col.to_numpy(zero_copy_only=False) for col in batch.columns]).astype(np.float32)
+    else:
+        for frame in pd.read_csv(path, chunksize=chunk_size, usecols=columns):
+            if columns is not None:
+                frame = frame[columns]
+            yield frame.to_numpy(dtype=np.float32)
+
+
+def predict_chunk(model: OnnxModel, features: np.ndarray) -> pd.DataFrame:
+    """1チャンク分の特徴量をまとめて推論し、ラベルと各クラスの確率の DataFrame を返す"""
+    labels, probabilities = model.predict(features)
+    result = pd.DataFrame(probabilities, columns=[f"probability_{i}" for i in range(probabilities.shape[1])])
+    result.insert(0, "label", labels)
+    return result
+
+
+def _init_worker(model_path: str) -> None:
+    global _worker_model
+    # 複数プロセスで並列に推論するため、各プロセス内のスレッド数は1にする
+    _worker_model = OnnxModel(model_path, intra_op_num_threads=1)
+
+
+def _predict_in_worker(features: np.ndarray) -> pd.DataFrame:
+    return predict_chunk(_worker_model, features)
+
+
+class PredictionWriter:
+    """推論結果をチャンクごとにCSV/Parquetへ追記する"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._parquet_writer: Optional[pq.ParquetWriter] = None
+        self._csv_header_written = False
+
+    def write(self, result: pd.DataFrame) -> None:
+        if _is_parquet(self.path):
+            table = pa.Table.from_pandas(result, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            result.to_csv(self.path, mode="a" if self._csv_header_written else "w",
+                          header=not self._csv_header_written, index=False)
+            self._csv_header_written = True
+
+    def close(self) -> None:
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+
+def predict_file(
+    model_path: str,
+    input_path: str,
+    output_path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = 1,
+    columns: Optional[List[str]] = None,
+) -> int:
+    """入力ファイルをチャンク単位で推論し、結果を出力ファイルへ順に書き出す
+    workers > 1 の場合はチャンクをプロセスプールに分散する。メモリを抑えるため、
+    処理中のチャンク数は workers の2倍までに制限し、入力と同じ順序で書き出す
+    :return: 推論した行数
+    """
+    writer = PredictionWriter(output_path)
+    rows = 0
+    try:
+        if workers <= 1:
+            model = OnnxModel(model_path)
+            for features in iter_chunks(input_path, chunk_size, columns):
+                writer.write(predict_chunk(model, features))
+                rows += len(features)
+            return rows
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,)) as executor:
+            pending = deque()
+            for features in iter_chunks(input_path, chunk_size, columns):
+                pending.append(executor.submit(_predict_in_worker, features))
+                rows += len(features)
+                if len(pending) >= workers * 2:
+                    writer.write(pending.popleft().result())
+            while pending:
+                writer.write(pending.popleft().result())
+        return rows
+    except BaseException:
+        # 途中で失敗した場合は不完全な出力を残さない
+        writer.close()
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    finally:
+        writer.close()
@@ -0,0 +1,121 @@
+import json
+import os
+import platform
+import time
+from datetime import datetime
+from typing import Callable, List
+
+import click
+import numpy as np
+import onnxruntime as ort
+import sklearn
+from threadpoolctl import threadpool_limits
+
+from script import fit_reference_model, to_onnx_bytes
+
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def measure(run: Callable[[], object], batch_size: int, repeats: int, warmup: int) -> dict:
+    """run() を repeats 回実行し、1回あたりのレイテンシ(p50/p99)と1秒あたりの処理行数を返す"""
+    for _ in range(warmup):
+        run()
+    latencies = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        run()
+        latencies[i] = time.perf_counter() - start
+    return {
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "rows_per_sec": float(batch_size * repeats / latencies.sum()),
+    }
+
+
+def benchmark_sklearn(model, X: np.ndarray, batch_sizes: List[int], threads: List[int], repeats: int, warmup: int) -> list:
+    results = []
+    for n_threads in threads:
+        # BLAS/OpenMP のスレッド数をONNX Runtimeのスレッド数とそろえる
+        with threadpool_limits(limits=n_threads):
+            for batch_size in batch_sizes:
+                batch = X[:batch_size]
+                stats = measure(lambda: model.predict_proba(batch), batch_size, repeats, warmup)
+                results.append({"runtime": "sklearn", "batch_size": batch_size, "threads": n_threads, **stats})
+    return results
+
+
+def benchmark_onnx(
+    onnx_bytes: bytes, X: np.ndarray, batch_sizes: List[int], threads: List[int],
+    execution_modes: List[str], repeats: int, warmup: int,
+) -> list:
+    results = []
+    for mode in execution_modes:
+        for n_threads in threads:
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = n_threads
+            options.execution_mode = EXECUTION_MODES[mode]
+            session = ort.InferenceSession(onnx_bytes, sess_options=options, providers=["CPUExecutionProvider"])
+            input_name = session.get_inputs()[0].name
+            for batch_size in batch_sizes:
+                batch = X[:batch_size].astype(np.float32)
+                stats = measure(lambda: session.run(None, {input_name: batch}), batch_size, repeats, warmup)
+                results.append({
+                    "runtime": "onnxruntime", "batch_size": batch_size, "threads": n_threads,
+                    "execution_mode": mode, **stats,
+                })
+    return results
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",")]
+
+
+@click.command()
+@click.option("--batch-sizes", default="1,8,64,512,4096", show_default=True, help="計測するバッチサイズ（カンマ区切り）")
+@click.option("--threads", default="1,2,4", show_default=True, help="計測するスレッド数（カンマ区切り）")
+@click.option("--execution-modes", default="sequential,parallel", show_default=True,
+              help="ONNX Runtimeの実行モード（sequential, parallel）")
+@click.option("--repeats", default=200, show_default=True, help="1条件あたりの計測回数")
+@click.option("--warmup", default=20, show_default=True, help="計測前のウォームアップ回数")
+@click.option("--output", default="benchmark_report.json", show_default=True, help="レポートの出力先 (JSON)")
+def cli(batch_sizes, threads, execution_modes, repeats, warmup, output):
+    """基準モデルを学習し、scikit-learnとONNX Runtimeの推論性能を比較する"""
+    batch_sizes = _int_list(batch_sizes)
+    threads = _int_list(threads)
+    execution_modes = execution_modes.split(",")
+
+    model = fit_reference_model()
+    onnx_bytes = to_onnx_bytes(model)
+    # 最大バッチサイズ分の入力を、学習データの範囲から一様に生成する
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 8, size=(max(batch_sizes), model.n_features_in_))
+
+    results = benchmark_sklearn(model, X, batch_sizes, threads, repeats, warmup)
+    results += benchmark_onnx(onnx_bytes, X, batch_sizes, threads, execution_modes, repeats, warmup)
+
+    report = {
+        "created": datetime.now().isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "sklearn": sklearn.__version__,
+            "onnxruntime": ort.__version__,
+        },
+        "settings": {"repeats": repeats, "warmup": warmup},
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for r in results:
+        click.echo(
+            f"{r['runtime']:<12} {r.get('execution_mode', ''):<10} batch={r['batch_size']:<5} threads={r['threads']} "
+            f"p50={r['p50_ms']:.3f}ms p99={r['p99_ms']:.3f}ms rows/s={r['rows_per_sec']:.0f}"
+        )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,269 @@
+import gzip
+import mimetypes
+import os
+import zlib
+from typing import Iterable, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.staticfiles import StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# brotli / zstd は、パッケージがインストールされている場合だけ使う
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4    # レスポンスごとに圧縮するため、圧縮率より速度を優先する
+ZSTD_LEVEL = 3
+DEFAULT_CONTENT_TYPES = [
+    "application/json",
+    "application/javascript",
+    "text/javascript",
+    "text/css",
+    "text/html",
+    "text/plain",
+    "image/svg+xml",
+]
+# ビルド時に圧縮したファイルの拡張子（配信時に優先する順）
+PRECOMPRESSED_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class GzipCompressor:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Content-Encoding の値と圧縮クラスの対応（インストールされているものだけ）
+COMPRESSORS = {"gzip": GzipCompressor}
+if brotli is not None:
+    COMPRESSORS["br"] = BrotliCompressor
+if zstandard is not None:
+    COMPRESSORS["zstd"] = ZstdCompressor
+
+
+def negotiate_encoding(accept_encoding: str, encodings: Iterable[str]) -> Optional[str]:
+    """Accept-Encoding の q 値が最も大きい圧縮方式を、同じ q 値ならサーバーの優先順で選ぶ"""
+    qualities = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def media_type(headers: Headers) -> str:
+    return headers.get("content-type", "").split(";")[0].strip().lower()
+
+
+class CompressionMiddleware:
+    """レスポンスを Accept-Encoding に応じて zstd / brotli / gzip で圧縮するASGIミドルウェア
+    minimum_size バイト未満の本文、content_types にない種類、圧縮済み（Content-Encoding あり）の
+    レスポンスはそのまま返す。
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        content_types: Iterable[str] = DEFAULT_CONTENT_TYPES,
+        encodings: Iterable[str] = ("zstd", "br", "gzip"),
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = {content_type.strip().lower() for content_type in content_types}
+        # 指定された優先順のうち、パッケージがインストールされているものだけを使う
+        self.encodings = [encoding for encoding in encodings if encoding in COMPRESSORS]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, CompressionResponder(self, encoding, send).send)
+
+    def should_compress(self, headers: Headers, body: bytes, more_body: bool) -> bool:
+        if "content-encoding" in headers or media_type(headers) not in self.content_types:
+            return False
+        if more_body:
+            # ストリーミングの場合は Content-Length があるときだけ大きさを判定できる
+            content_length = headers.get("content-length")
+            return content_length is None or int(content_length) >= self.minimum_size
+        return len(body) >= self.minimum_size
+
+
+class CompressionResponder:
+    """1つのレスポンスについて、最初の本文を見てから圧縮するかを決める"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self.start_message: Optional[Message] = None
+        self.compressor = None
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # ヘッダは本文の大きさが分かるまで送らずに保持する
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body":
+            await self.flush_start()
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is None:
+            # 2つ目以降の本文
+            if self.compressor is not None:
+                body = self.compressor.compress(body)
+                if not more_body:
+                    body += self.compressor.finish()
+                message = {"type": "http.response.body", "body": body, "more_body": more_body}
+            await self._send(message)
+            return
+
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        if not self.middleware.should_compress(headers, body, more_body):
+            await self.flush_start()
+            await self._send(message)
+            return
+
+        self.compressor = COMPRESSORS[self.encoding]()
+        compressed = self.compressor.compress(body)
+        if not more_body:
+            compressed += self.compressor.finish()
+            if len(compressed) >= len(body):
+                # 圧縮しても小さくならない場合はそのまま返す
+                self.compressor = None
+                await self.flush_start()
+                await self._send(message)
+                return
+            headers["Content-Length"] = str(len(compressed))
+        elif "content-length" in headers:
+            del headers["Content-Length"]
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        await self.flush_start()
+        await self._send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+    async def flush_start(self) -> None:
+        if self.start_message is not None:
+            await self._send(self.start_message)
+            self.start_message = None
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """ビルド時に圧縮した .br / .gz ファイルがあれば、Accept-Encoding に応じてそちらを返す StaticFiles
+    immutable_prefixes で始まるパス（ファイル名にハッシュを含むビルド成果物）には、
+    1年間再検証不要の Cache-Control を付ける。
+    """
+
+    def __init__(self, *args, immutable_prefixes: Iterable[str] = (), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.immutable_prefixes = tuple(immutable_prefixes)
+
+    async def get_response(self, path: str, scope: Scope):
+        response = await self.get_precompressed_response(path, scope) or await super().get_response(path, scope)
+        if self.immutable_prefixes and path.startswith(self.immutable_prefixes) and response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    async def get_precompressed_response(self, path: str, scope: Scope):
+        if scope["method"] not in ("GET", "HEAD"):
+            return None
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), PRECOMPRESSED_EXTENSIONS)
+        if encoding is None:
+            return None
+        full_path, stat_result = self.lookup_path(path + PRECOMPRESSED_EXTENSIONS[encoding])
+        if stat_result is None or not os.path.isfile(full_path):
+            return None
+        response = self.file_response(full_path, stat_result, scope)
+        # Content-Type は圧縮前のファイル名から決める
+        response.headers["Content-Type"] = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        response.headers["Content-Encoding"] = encoding
+        response.headers.add_vary_header("Accept-Encoding")
+        return response
+
+
+def precompress_directory(directory: str, minimum_size: int, content_types: Iterable[str]) -> List[str]:
+    """directory 以下の圧縮対象のファイルを、最高圧縮率の .gz（brotli があれば .br も）にする
+    圧縮済みのファイルが元のファイルより新しい場合は作り直さない。
+
+    :return: 作成したファイルのパス
+    """
+    content_types = {content_type.strip().lower() for content_type in content_types}
+    created = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith((".gz", ".br")) or (mimetypes.guess_type(name)[0] or "") not in content_types:
+                continue
+            if os.path.getsize(path) < minimum_size:
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            targets = [(".gz", lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                targets.append((".br", lambda: brotli.compress(data, quality=11)))
+            for extension, compress in targets:
+                target = path + extension
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                    continue
+                compressed = compress()
+                if len(compressed) >= len(data):
+                    continue
+                with open(target, "wb") as f:
+                    f.write(compressed)
+                created.append(target)
+    return created
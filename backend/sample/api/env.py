@@ -16,6 +16,39 @@ class Environment(BaseSettings):
     token_algorithm: str = "HS256"
 
     db_url: str = Field(..., env="DB_URL")
+    # 読み取り専用のレプリカの接続文字列（カンマ区切り）。空の場合はすべてプライマリを使う
+    db_replica_urls: str = ""
+    db_replica_retry_interval: float = 30.0  # 接続できなかったレプリカを振り分け先から外す時間（秒）
+    read_your_writes_seconds: float = 5.0    # 書き込み後にそのクライアントの読み取りをプライマリに送る時間（秒）
+
+    # ONNXモデルによる推論の設定
+    model_registry_dir: str = "../model/registry"
+    model_poll_interval: float = 5.0   # 新しいモデルのバージョンを確認する間隔（秒）
+    model_warmup_runs: int = 3         # 切り替え前に実行するウォームアップ推論の回数
+    prediction_cache_size: int = 10000      # 推論結果キャッシュの最大件数
+    prediction_cache_ttl: float = 300.0     # 推論結果キャッシュの有効期間（秒）
+    prediction_cache_decimals: int = 4      # キャッシュキー作成時に特徴量を丸める小数点以下の桁数
+    predict_max_batch_size: int = 64   # 1回の推論にまとめる最大リクエスト数
+    predict_max_wait_ms: float = 5.0   # バッチがたまるのを待つ最大時間（ミリ秒）
+
+    item_bulk_max_operations: int = 1000  # アイテムの一括操作APIで1リクエストに指定できる最大件数
+    # 一括作成で1回の複数行 INSERT にまとめる本文の最大バイト数（MySQL の max_allowed_packet より小さくする）
+    # MySQL では1回の INSERT の行に、最初のidから連続したidが採番されたとみなす。
+    # 行数が決まっている複数行 INSERT（simple insert）は innodb_autoinc_lock_mode が 0 / 1 / 2 のいずれでも
+    # 連続したidになるが、auto_increment_increment は 1 であること（マルチプライマリ構成などで変更しないこと）
+    item_bulk_insert_max_bytes: int = 4 * 1024 * 1024
+
+    # レスポンス圧縮の設定（brotli / zstandard はインストールされている場合だけ使う）
+    compression_minimum_size: int = 1024   # これより小さい本文は圧縮しない（バイト）
+    compression_content_types: str = (     # 圧縮するContent-Type（カンマ区切り）
+        "application/json,application/javascript,text/javascript,text/css,text/html,text/plain,image/svg+xml"
+    )
+    compression_encodings: str = "zstd,br,gzip"  # 使用する圧縮方式（優先する順、カンマ区切り）
+    static_immutable_prefixes: str = "_nuxt/"    # ファイル名にハッシュを含む静的ファイルのパス（カンマ区切り）
+
+    # ユーザー削除の設定
+    user_purge_threshold: int = 10000  # アイテムがこの件数より多いユーザーはバックグラウンドで削除する
+    user_purge_batch_size: int = 1000  # バックグラウンドでの削除で1回のトランザクションで削除するアイテムの件数
 
     class Config:
         env_file = "../.env"
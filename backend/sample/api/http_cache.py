@@ -0,0 +1,71 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional, Tuple
+
+from fastapi import Request, Response, status
+
+# 認証が必要なレスポンスなので共有キャッシュには保存させず、クライアントには毎回再検証させる
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(rows: Iterable[Tuple]) -> str:
+    """(id, updated, ...) の組から弱いETagを作る
+    一覧の場合はページ内の全行から作るため、行の追加・削除・更新のどれでも値が変わる。
+    3つ目以降の値（ユーザーのロールのidなど）もETagに含める
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(repr((row[0], row[1].isoformat(), *row[2:])).encode())
+        digest.update(b";")
+    return f'W/"{digest.hexdigest()}"'
+
+
+def to_http_date(value: datetime) -> str:
+    # updated は datetime.now() で保存したローカル時刻（タイムゾーンなし）
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """If-None-Match / If-Modified-Since から、クライアントのキャッシュが最新かを判定する
+    RFC 9110 に従い、If-None-Match がある場合は If-Modified-Since を無視する
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # GET の比較は弱い比較（W/ の有無を無視する）
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    # HTTP の日付は秒単位のため、秒未満を切り捨てて比較する（クライアントが受け取った Last-Modified と一致させる）。
+    # 同じ秒のうちの更新は区別できないが、If-None-Match（ETag）を送るクライアントは優先的にそちらで判定される
+    return last_modified.astimezone(timezone.utc).replace(microsecond=0) <= since
+
+
+def conditional_response(
+    request: Request, response: Response, rows: Iterable[Tuple[int, datetime]]
+) -> Optional[Response]:
+    """検証用のヘッダを response に設定し、クライアントのキャッシュが最新であれば304のレスポンスを返す
+
+    :param rows: レスポンスに含まれるリソースの (id, updated, ...) の組
+    :return: 304 Not Modified のレスポンス。本文を返す必要がある場合は None
+    """
+    rows = list(rows)
+    etag = make_etag(rows)
+    last_modified = max((row[1] for row in rows), default=None)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = to_http_date(last_modified)
+
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
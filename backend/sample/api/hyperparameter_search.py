@@ -0,0 +1,141 @@
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple
+
+import click
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.datasets import load_iris
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+from threadpoolctl import threadpool_limits
+
+from script import MODEL_DIR, SKLEARN_MODEL_FILE, convert
+
+SEARCH_CACHE_DIR = "search_cache"
+DEFAULT_GRID = {"C": [0.01, 0.1, 1.0, 10.0, 100.0], "max_iter": [500]}
+DEFAULT_FOLDS = 5
+DEFAULT_TOLERANCE = 0.02
+
+# ワーカープロセスごとに1回だけ受け取る学習データ
+_worker_data: Optional[Tuple[np.ndarray, np.ndarray, str, str]] = None
+# 全プロセスで共有する、打ち切られずに完了した試行の最良スコア
+_best_score = None
+
+
+def load_data(path: Optional[str], label_column: str) -> Tuple[np.ndarray, np.ndarray]:
+    """CSV/Parquetファイルを特徴量とラベルに分けて読み込む（省略時はirisデータセット）"""
+    if path is None:
+        return load_iris(return_X_y=True)
+    frame = pd.read_parquet(path) if path.endswith((".parquet", ".pq")) else pd.read_csv(path)
+    return frame.drop(columns=[label_column]).to_numpy(dtype=np.float32), frame[label_column].to_numpy()
+
+
+def data_fingerprint(X: np.ndarray, y: np.ndarray) -> str:
+    """学習データの内容から、キャッシュキーに使うハッシュ値を作る"""
+    digest = hashlib.blake2b(digest_size=16)
+    for array in (X, y):
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype}{array.shape}".encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def _fold_cache_path(cache_dir: str, fingerprint: str, params: dict, fold: int, n_folds: int) -> str:
+    key = json.dumps({"data": fingerprint, "params": params, "fold": fold, "n_folds": n_folds}, sort_keys=True)
+    return os.path.join(cache_dir, f"{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}.json")
+
+
+def _init_worker(X: np.ndarray, y: np.ndarray, fingerprint: str, cache_dir: str, best_score) -> None:
+    global _worker_data, _best_score
+    _worker_data = (X, y, fingerprint, cache_dir)
+    _best_score = best_score
+
+
+def evaluate_trial(params: dict, n_folds: int, tolerance: float) -> dict:
+    """交差検証で1つのパラメータを評価する
+    学習済みの fold のスコアはディスクのキャッシュから読み込む。途中までの平均スコアが
+    他の試行の最良スコアを tolerance 以上下回った時点で、残りの fold は学習せずに打ち切る
+    """
+    X, y, fingerprint, cache_dir = _worker_data
+    folds = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=0).split(X, y)
+    scores: List[float] = []
+    for fold, (train_index, test_index) in enumerate(folds):
+        cache_path = _fold_cache_path(cache_dir, fingerprint, params, fold, n_folds)
+        if os.path.exists(cache_path):
+            with open(cache_path) as f:
+                score = json.load(f)["score"]
+        else:
+            # 複数プロセスで並列に学習するため、各プロセス内のスレッド数は1にする
+            with threadpool_limits(limits=1):
+                model = LogisticRegression(**params).fit(X[train_index], y[train_index])
+                score = float(model.score(X[test_index], y[test_index]))
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"params": params, "fold": fold, "score": score}, f)
+            os.replace(tmp_path, cache_path)
+        scores.append(score)
+        if np.mean(scores) < _best_score.value - tolerance:
+            return {"params": params, "scores": scores, "mean": float(np.mean(scores)), "pruned": True}
+    mean = float(np.mean(scores))
+    with _best_score.get_lock():
+        _best_score.value = max(_best_score.value, mean)
+    return {"params": params, "scores": scores, "mean": mean, "pruned": False}
+
+
+def search(
+    X: np.ndarray,
+    y: np.ndarray,
+    grid: dict,
+    cache_dir: str,
+    n_folds: int = DEFAULT_FOLDS,
+    workers: Optional[int] = None,
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> List[dict]:
+    """パラメータの組み合わせをプロセスプールで並列に評価し、全試行の結果を返す"""
+    os.makedirs(cache_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    best_score = multiprocessing.Value("d", -np.inf)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(X, y, data_fingerprint(X, y), cache_dir, best_score)) as executor:
+        futures = [executor.submit(evaluate_trial, params, n_folds, tolerance) for params in ParameterGrid(grid)]
+        return [future.result() for future in as_completed(futures)]
+
+
+@click.command()
+@click.option("--train-file", "train_path", type=click.Path(exists=True, dir_okay=False), default=None,
+              help="学習データのCSV/Parquetファイル（省略時はirisデータセット）")
+@click.option("--label-column", default="label", show_default=True, help="学習データのラベル列")
+@click.option("--grid", "grid_json", default=json.dumps(DEFAULT_GRID), show_default=True,
+              help="LogisticRegression のパラメータ候補（JSON）")
+@click.option("--folds", default=DEFAULT_FOLDS, show_default=True, help="交差検証の分割数")
+@click.option("--workers", default=None, type=int, help="試行を並列に実行するプロセス数（省略時はCPUコア数）")
+@click.option("--tolerance", default=DEFAULT_TOLERANCE, show_default=True,
+              help="最良スコアからこの値以上下回った試行を打ち切る")
+@click.option("--export/--no-export", default=True, show_default=True,
+              help="最良のパラメータで全データを学習し、ONNXモデルとしてレジストリに登録する")
+@click.option("--model-dir", default=MODEL_DIR, show_default=True, help="モデルの保存先ディレクトリ")
+def cli(train_path, label_column, grid_json, folds, workers, tolerance, export, model_dir):
+    X, y = load_data(train_path, label_column)
+    results = search(X, y, json.loads(grid_json), os.path.join(model_dir, SEARCH_CACHE_DIR),
+                     n_folds=folds, workers=workers, tolerance=tolerance)
+
+    for result in sorted(results, key=lambda r: (r["pruned"], -r["mean"])):
+        status = "pruned" if result["pruned"] else "done"
+        click.echo(f"{result['mean']:.4f}  {status:<6}  folds={len(result['scores'])}  {result['params']}")
+
+    best = max((r for r in results if not r["pruned"]), key=lambda r: r["mean"])
+    click.echo(f"best: {best['params']} (cv score {best['mean']:.4f})")
+    if export:
+        model = LogisticRegression(**best["params"]).fit(X, y)
+        os.makedirs(model_dir, exist_ok=True)
+        joblib.dump(model, os.path.join(model_dir, SKLEARN_MODEL_FILE))
+        convert(model_dir, {"params": best["params"], "cv_score": best["mean"]})
+
+
+if __name__ == "__main__":
+    cli()
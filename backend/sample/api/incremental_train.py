@@ -0,0 +1,132 @@
+import os
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sqlalchemy import create_engine, text
+
+DEFAULT_TRAIN_CHUNK_SIZE = 50_000
+DEFAULT_EPOCHS = 5
+DEFAULT_CHECKPOINT_EVERY = 10  # 何チャンクごとにチェックポイントを保存するか
+
+# 呼び出すたびにデータの先頭から (特徴量, ラベル) のチャンクを返すイテレータを作る関数
+ChunkSource = Callable[[], Iterator[Tuple[np.ndarray, np.ndarray]]]
+
+
+def _split(frame: pd.DataFrame, label_column: str, columns: Optional[List[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """DataFrame を float32 の特徴量とラベルに分ける"""
+    features = frame[columns] if columns else frame.drop(columns=[label_column])
+    return features.to_numpy(dtype=np.float32), frame[label_column].to_numpy()
+
+
+def file_chunks(path: str, chunk_size: int, label_column: str, columns: Optional[List[str]] = None) -> ChunkSource:
+    """CSV/Parquetファイルを chunk_size 行ずつ読み込むチャンクソース"""
+    usecols = columns + [label_column] if columns else None
+
+    def iterate():
+        if path.endswith((".parquet", ".pq")):
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=usecols):
+                yield _split(batch.to_pandas(), label_column, columns)
+        else:
+            for frame in pd.read_csv(path, chunksize=chunk_size, usecols=usecols):
+                yield _split(frame, label_column, columns)
+
+    return iterate
+
+
+def query_chunks(db_url: str, query: str, chunk_size: int, label_column: str,
+                 columns: Optional[List[str]] = None) -> ChunkSource:
+    """SQLの結果をサーバーサイドカーソルで chunk_size 行ずつ読み込むチャンクソース
+    結果全体をクライアントに取り込まないため、テーブルがメモリより大きくても読み込める
+    """
+    engine = create_engine(db_url)
+
+    def iterate():
+        with engine.connect() as conn:
+            # yield_per を指定すると stream_results が有効になり、PostgreSQL では名前付きカーソルが使われる
+            result = conn.execution_options(yield_per=chunk_size).execute(text(query))
+            keys = list(result.keys())
+            for rows in result.partitions():
+                yield _split(pd.DataFrame(rows, columns=keys), label_column, columns)
+
+    return iterate
+
+
+class IncrementalTrainer:
+    """チャンク単位で partial_fit を繰り返し、メモリに収まらないデータで学習する
+    1回目の走査で標準化の統計量とクラスを集計し、その後 epochs 回の走査で分類器を学習する。
+    checkpoint_path を指定すると途中経過を保存し、中断しても続きから再開できる
+    """
+
+    def __init__(self, checkpoint_path: Optional[str] = None, checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+                 random_state: int = 0):
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.rng = np.random.default_rng(random_state)
+        self.scaler = StandardScaler()
+        self.classifier = SGDClassifier(loss="log_loss", random_state=random_state)
+        self.classes: Optional[np.ndarray] = None
+        self.epoch = 0
+        self.chunks_done = 0  # 現在のエポックで学習済みのチャンク数
+
+    def _save_checkpoint(self) -> None:
+        if self.checkpoint_path is None:
+            return
+        state = {
+            "scaler": self.scaler,
+            "classifier": self.classifier,
+            "classes": self.classes,
+            "epoch": self.epoch,
+            "chunks_done": self.chunks_done,
+        }
+        # 書き込み途中で中断されても前回のチェックポイントが壊れないよう、一時ファイルから置き換える
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        joblib.dump(state, tmp_path)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _load_checkpoint(self) -> bool:
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return False
+        state = joblib.load(self.checkpoint_path)
+        self.scaler = state["scaler"]
+        self.classifier = state["classifier"]
+        self.classes = state["classes"]
+        self.epoch = state["epoch"]
+        self.chunks_done = state["chunks_done"]
+        return True
+
+    def _collect_statistics(self, source: ChunkSource) -> None:
+        """標準化の平均・分散とラベルの種類をチャンクごとに集計する"""
+        classes = set()
+        for features, labels in source():
+            self.scaler.partial_fit(features)
+            classes.update(np.unique(labels).tolist())
+        if not classes:
+            raise ValueError("No training data.")
+        self.classes = np.array(sorted(classes))
+        self._save_checkpoint()
+
+    def fit(self, source: ChunkSource, epochs: int = DEFAULT_EPOCHS) -> Pipeline:
+        """学習済みの標準化と分類器をまとめた Pipeline を返す（ONNX変換にそのまま使える）"""
+        if not self._load_checkpoint():
+            self._collect_statistics(source)
+        while self.epoch < epochs:
+            for i, (features, labels) in enumerate(source()):
+                if i < self.chunks_done:
+                    # チェックポイントまでに学習したチャンクは読み飛ばす
+                    continue
+                # partial_fit はデータを並べ替えないため、チャンク内で行をシャッフルする
+                order = self.rng.permutation(len(labels))
+                self.classifier.partial_fit(self.scaler.transform(features[order]), labels[order], classes=self.classes)
+                self.chunks_done = i + 1
+                if self.chunks_done % self.checkpoint_every == 0:
+                    self._save_checkpoint()
+            self.epoch += 1
+            self.chunks_done = 0
+            self._save_checkpoint()
+        return make_pipeline(self.scaler, self.classifier)
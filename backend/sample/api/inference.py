@@ -0,0 +1,104 @@
+import asyncio
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import onnxruntime as ort
+
+
+class OnnxModel:
+    """ONNX Runtime の推論セッションをラップするクラス
+    セッションはプロセス内で1回だけ作成し、全リクエストで共有する
+    """
+
+    def __init__(self, model_path: str, intra_op_num_threads: int = 0, version: Optional[str] = None):
+        self.version = version
+        options = ort.SessionOptions()
+        # 0 の場合は ONNX Runtime がコア数に応じて決める
+        options.intra_op_num_threads = intra_op_num_threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.n_features = model_input.shape[1]
+
+    def predict(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """特徴量の2次元配列 (batch, n_features) からラベルと各クラスの確率を返す"""
+        labels, probabilities = self.session.run(None, {self.input_name: features.astype(np.float32, copy=False)})
+        return labels, probabilities
+
+
+class MicroBatcher:
+    """同時に届いた推論リクエストをまとめて1回の推論で処理するクラス
+    最初のリクエストから max_wait_ms 待つか、max_batch_size 件たまった時点でバッチを実行する
+    """
+
+    def __init__(self, model: OnnxModel, max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """バッチ処理のワーカーを起動する（イベントループ上で呼び出すこと）"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """ワーカーを停止する"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def predict(
+        self, features: Sequence[float], model: Optional[OnnxModel] = None
+    ) -> Tuple[Optional[str], int, List[float]]:
+        """1件の特徴量を推論キューに入れ、バッチ推論の結果（モデルのバージョン, ラベル, 確率）を待つ
+        :param model: 推論に使うモデル。省略した場合はキューに入れた時点の self.model を使う。
+                      特徴量の数を検証したモデルを渡せば、待機中にモデルが差し替えられても同じモデルで推論する
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((features, model or self.model, future))
+        return await future
+
+    async def _collect(self) -> list:
+        """1バッチ分のリクエストをキューから取り出す"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            # 待機中にモデルが差し替えられた場合に備え、リクエストが指定したモデルごとに推論する
+            groups = {}
+            for features, model, future in batch:
+                groups.setdefault(id(model), (model, []))[1].append((features, future))
+            for model, requests in groups.values():
+                await self._predict_batch(model, requests)
+
+    async def _predict_batch(self, model: OnnxModel, requests: list) -> None:
+        features = np.asarray([item[0] for item in requests], dtype=np.float32)
+        try:
+            # 推論中もイベントループを止めないよう、別スレッドで実行する
+            labels, probabilities = await asyncio.to_thread(model.predict, features)
+        except Exception as e:
+            for _, future in requests:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for i, (_, future) in enumerate(requests):
+            if not future.done():
+                future.set_result((model.version, int(labels[i]), probabilities[i].tolist()))
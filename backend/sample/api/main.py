@@ -1,9 +1,66 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from routers import router
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+from compression import CompressionMiddleware, PrecompressedStaticFiles
+from env import Environment
+from inference import MicroBatcher, OnnxModel
+from model_registry import ModelRegistry, ModelWatcher
+from prediction_cache import PredictionCache
+from session import mark_read_primary, replica_engines
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動時にレジストリの有効なモデルを読み込み、以降は新しいバージョンを監視して切り替える"""
+    env = Environment()
+    app.state.batcher = None
+    app.state.prediction_cache = PredictionCache(
+        env.prediction_cache_size, env.prediction_cache_ttl, env.prediction_cache_decimals
+    )
+
+    def swap_model(model: OnnxModel) -> None:
+        # ウォームアップ済みのモデルに差し替える。処理中のバッチは古いモデルのまま完了する
+        if app.state.batcher is None:
+            batcher = MicroBatcher(model, env.predict_max_batch_size, env.predict_max_wait_ms)
+            batcher.start()
+            app.state.batcher = batcher
+        else:
+            app.state.batcher.model = model
+
+    watcher = ModelWatcher(
+        ModelRegistry(env.model_registry_dir),
+        swap_model,
+        poll_interval=env.model_poll_interval,
+        warmup_runs=env.model_warmup_runs,
+        warmup_batch_size=env.predict_max_batch_size,
+    )
+    await watcher.refresh()
+    watcher.start()
+    yield
+    await watcher.stop()
+    if app.state.batcher is not None:
+        await app.state.batcher.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+env = Environment()
+
+
+def split_setting(value: str) -> list:
+    """カンマ区切りの設定値をリストにする"""
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+
+# 大きな一覧のJSONや静的ファイルを、クライアントが対応している方式で圧縮して返す
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=env.compression_minimum_size,
+    content_types=split_setting(env.compression_content_types),
+    encodings=split_setting(env.compression_encodings),
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -13,8 +70,25 @@ app.add_middleware(
     allow_headers=["*"],     # クロスオリジンリクエストで許可されるHTTPヘッダのリスト。 "*" はすべて許可。
 )
 
+
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    """書き込みに成功したクライアントの読み取りを、レプリカに反映されるまでプライマリに送る"""
+    response = await call_next(request)
+    if replica_engines and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        mark_read_primary(response)
+    return response
+
+
 app.include_router(router, prefix="/api/v1")
 
 # html=True : パスの末尾が "/" の時に自動的に index.html をロードする
 # name="static" : FastAPIが内部的に利用する名前を付けます
-app.mount("/", StaticFiles(directory=f"../static", html=True), name="static")
\ No newline at end of file
+# ビルド時に作成した .br / .gz があればそちらを返す（python manage.py precompress-static で作成）
+app.mount(
+    "/",
+    PrecompressedStaticFiles(
+        directory=f"../static", html=True, immutable_prefixes=split_setting(env.static_immutable_prefixes)
+    ),
+    name="static",
+)
\ No newline at end of file
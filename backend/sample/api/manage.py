@@ -1,8 +1,11 @@
 import click
 
 from model import User, Role, RoleType
-from session import SessionLocal
+from compression import precompress_directory
+from env import Environment
+from session import SessionLocal, engine
 import auth
+import user_purge
 
 
 @click.group()
@@ -38,14 +41,28 @@ def create_user(user_name, role_type, password):
 
 @cli.command()
 @click.argument("user_name", type=str)
-def delete_user(user_name):
+@click.option("--batch-size", type=int, default=Environment().user_purge_batch_size, show_default=True,
+              help="1回のトランザクションで削除するアイテムの件数")
+def delete_user(user_name, batch_size):
     with SessionLocal() as session:
-        # userの重複確認
+        # userの存在確認
         user = session.query(User).filter(User.username == user_name).first()
         if user is None:
-            raise Exception(f"{user_name} is already exists.")
-        session.delete(user)
-        session.commit()
+            raise Exception(f"{user_name} is not exists.")
+        user_id = user.id
+    # アイテムが多いユーザーでも長いトランザクションにならないよう、アイテムを少しずつ削除する
+    # （API のバックグラウンド削除が途中で止まったユーザーの削除にも使える）
+    deleted = user_purge.purge_user(engine, user_id, batch_size)
+    click.echo(f"deleted {user_name} and {deleted} items")
+
+@cli.command()
+@click.option("-d", "--directory", default="../static", show_default=True, help="圧縮する静的ファイルのディレクトリ")
+def precompress_static(directory):
+    """静的ファイルの .gz / .br をビルド時に作成する（brotli がインストールされている場合は .br も作成）"""
+    env = Environment()
+    content_types = [content_type for content_type in env.compression_content_types.split(",") if content_type]
+    for path in precompress_directory(directory, env.compression_minimum_size, content_types):
+        click.echo(f"created {path}")
 
 if __name__ == "__main__":
     cli()
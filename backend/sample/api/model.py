@@ -4,25 +4,31 @@ from sqlalchemy import Boolean, Column, Integer, String, UniqueConstraint, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.sqltypes import DateTime, Enum
 from sqlalchemy.sql.schema import ForeignKey
-from sqlalchemy.dialects.mysql import MEDIUMTEXT
+from sqlalchemy.dialects.mysql import DATETIME, MEDIUMTEXT
 
 # モデルのベースクラスを定義
 from sqlalchemy.orm.decl_api import declarative_base
 Base = declarative_base()
 
+# ETag / Last-Modified に使う更新日時。MySQL の DATETIME は秒単位のため、
+# 同じ秒の更新も区別できるようマイクロ秒まで保存する
+UpdatedDateTime = DateTime().with_variant(DATETIME(fsp=6), "mysql")
+
 class User(Base):
     """usersテーブル
     モデル定義: https://docs.sqlalchemy.org/en/14/tutorial/metadata.html#defining-table-metadata-with-the-orm
     """
     __tablename__ = "users"
     __table_args__ = {'sqlite_autoincrement': True}
+    # INSERT/UPDATE 時にサーバー側で生成された値を RETURNING で同時に取得し、後からの SELECT を不要にする
+    __mapper_args__ = {"eager_defaults": True}
     
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(255), unique=True, index=True, nullable=False)
     hashed_password = Column(String(255), nullable=False)
     age = Column(Integer, nullable=True)
     created = Column(DateTime, default=datetime.now, nullable=False)
-    updated = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
+    updated = Column(UpdatedDateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
 
     # itemsテーブルとの一対多のリレーション
     #   https://docs.sqlalchemy.org/en/14/orm/basic_relationships.html#one-to-many
@@ -33,11 +39,13 @@ class User(Base):
         #   "all, delete-orphan": userを削除したときに、関連する items を削除する
         #   "save-update": userを削除したときに、関連する items のuser_idをNullにする (default)
         cascade="all, delete-orphan",
+        # items の削除は外部キーの ON DELETE CASCADE に任せ、userの削除時にitemsを読み込まない
+        passive_deletes=True,
     )
 
     # リレーション (many to many)
     #   多対多のリレーション: https://docs.sqlalchemy.org/en/14/orm/basic_relationships.html#many-to-many
-    roles = relationship("Role", secondary="user_roles", back_populates="users")
+    roles = relationship("Role", secondary="user_roles", back_populates="users", passive_deletes=True)
 
     def __repr__(self):
         return f"<User(id={self.id}, username={self.username},items={self.items}, roles={self.roles})>"
@@ -48,13 +56,14 @@ class Item(Base):
     """
     __tablename__ = "items"
     __table_args__ = {'sqlite_autoincrement': True}
+    __mapper_args__ = {"eager_defaults": True}
     
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     title = Column(String(255), nullable=False)
     content = Column(MEDIUMTEXT)
     created = Column(DateTime, default=datetime.now, nullable=False)
-    updated = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
+    updated = Column(UpdatedDateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
 
     #  usersテーブルとのリレーション
     user = relationship("User", back_populates="items")
@@ -71,7 +80,7 @@ class UserRole(Base):
     )
 
     id = Column(Integer, primary_key=True, index=True, nullable=False)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     role_id = Column(Integer, ForeignKey("roles.id"), nullable=False)
     created = Column(DateTime, default=datetime.now, nullable=False)
     updated = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from inference import OnnxModel
+
+MODEL_FILE = "model.onnx"
+METADATA_FILE = "metadata.json"
+CURRENT_FILE = "CURRENT"
+
+
+class ModelRegistry:
+    """バージョン管理されたONNXモデルをファイルで管理するレジストリ
+    ディレクトリ構成:
+        <root>/v1/model.onnx, <root>/v1/metadata.json, ...
+        <root>/CURRENT  ... 有効なバージョン名
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def list_versions(self) -> List[str]:
+        """登録済みのバージョンを古い順に返す"""
+        if not os.path.isdir(self.root):
+            return []
+        versions = [
+            name for name in os.listdir(self.root)
+            if name.startswith("v") and name[1:].isdigit() and os.path.isdir(os.path.join(self.root, name))
+        ]
+        return sorted(versions, key=lambda name: int(name[1:]))
+
+    def current_version(self) -> Optional[str]:
+        """有効なバージョン名を返す（未登録の場合は None）"""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def model_path(self, version: str) -> str:
+        return os.path.join(self.root, version, MODEL_FILE)
+
+    def metadata(self, version: str) -> dict:
+        with open(os.path.join(self.root, version, METADATA_FILE)) as f:
+            return json.load(f)
+
+    def publish(self, onnx_bytes: bytes, metadata: dict, activate: bool = True) -> str:
+        """新しいバージョンとしてモデルを登録する
+        一時ディレクトリに書き込んでからリネームするため、書き込み途中のモデルが読まれることはない
+        """
+        os.makedirs(self.root, exist_ok=True)
+        versions = self.list_versions()
+        version = f"v{int(versions[-1][1:]) + 1 if versions else 1}"
+        tmp_dir = os.path.join(self.root, f".tmp-{version}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        with open(os.path.join(tmp_dir, MODEL_FILE), "wb") as f:
+            f.write(onnx_bytes)
+        with open(os.path.join(tmp_dir, METADATA_FILE), "w") as f:
+            json.dump({"version": version, "created": datetime.now().isoformat(), **metadata}, f, indent=2)
+        os.rename(tmp_dir, os.path.join(self.root, version))
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version: str) -> None:
+        """有効なバージョンを切り替える（ロールバックにも使用する）"""
+        if not os.path.exists(self.model_path(version)):
+            raise ValueError(f"{version} is not registered.")
+        tmp_path = os.path.join(self.root, f".{CURRENT_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(self.root, CURRENT_FILE))
+
+
+def load_model(registry: ModelRegistry, version: str, warmup_runs: int = 3, warmup_batch_size: int = 64) -> OnnxModel:
+    """モデルを読み込み、切り替え前にウォームアップの推論を実行する
+    初回推論時のメモリ確保などのコストを、リクエストではなくここで支払う
+    """
+    model = OnnxModel(registry.model_path(version), version=version)
+    for batch_size in (1, warmup_batch_size):
+        features = np.zeros((batch_size, model.n_features), dtype=np.float32)
+        for _ in range(warmup_runs):
+            model.predict(features)
+    return model
+
+
+class ModelWatcher:
+    """レジストリの CURRENT を監視し、新しいバージョンをバックグラウンドで読み込んで切り替える"""
+
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        on_swap: Callable[[OnnxModel], None],
+        poll_interval: float = 5.0,
+        warmup_runs: int = 3,
+        warmup_batch_size: int = 64,
+    ):
+        self.registry = registry
+        self.on_swap = on_swap
+        self.poll_interval = poll_interval
+        self.warmup_runs = warmup_runs
+        self.warmup_batch_size = warmup_batch_size
+        self.loaded_version: Optional[str] = None
+        self.failed_version: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def check(self) -> None:
+        """CURRENT が変わっていれば新しいバージョンを読み込み、ウォームアップ後に切り替える"""
+        version = self.registry.current_version()
+        if version is None or version in (self.loaded_version, self.failed_version):
+            return
+        try:
+            # 読み込みとウォームアップはイベントループを止めないよう別スレッドで実行する
+            model = await asyncio.to_thread(
+                load_model, self.registry, version, self.warmup_runs, self.warmup_batch_size
+            )
+        except Exception:
+            # 同じバージョンの読み込みを繰り返さない
+            self.failed_version = version
+            raise
+        self.on_swap(model)
+        self.loaded_version = version
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def refresh(self) -> None:
+        """check() を実行する。壊れたモデルが登録されても、現在のモデルで推論を続ける"""
+        try:
+            await self.check()
+        except Exception as e:
+            print(f"Failed to load model {self.registry.current_version()}: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await self.refresh()
@@ -0,0 +1,47 @@
+import hashlib
+from typing import Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+from cachetools import TTLCache
+
+
+class PredictionCache:
+    """推論結果のLRUキャッシュ
+    キーは (モデルのバージョン, 丸めた特徴量のハッシュ)。同じ特徴量の推論はモデルを実行せずに返す
+    件数の上限を超えると最も古く使われたものから、ttl 秒を過ぎたものは期限切れとして破棄する
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0, decimals: int = 4):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, version: Optional[str], features: Sequence[float]) -> Tuple[Optional[str], Hashable]:
+        """特徴量を decimals 桁に丸めてハッシュ化したキャッシュキーを返す"""
+        # + 0.0 で -0.0 を 0.0 にそろえる
+        quantized = np.round(np.asarray(features, dtype=np.float64), self.decimals) + 0.0
+        return version, hashlib.blake2b(quantized.tobytes(), digest_size=16).digest()
+
+    def get(self, version: Optional[str], features: Sequence[float]):
+        result = self._cache.get(self.key(version, features))
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def set(self, version: Optional[str], features: Sequence[float], result) -> None:
+        self._cache[self.key(version, features)] = result
+
+    def stats(self) -> dict:
+        """ヒット率などのメトリクスを返す"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": self._cache.currsize,
+            "maxsize": self._cache.maxsize,
+            "ttl": self._cache.ttl,
+        }
@@ -1,16 +1,18 @@
 from typing import List
 from datetime import timedelta, datetime, UTC
 
-from sqlalchemy import and_
+from sqlalchemy import and_, delete as sql_delete, insert, select, update as sql_update
 from sqlalchemy.orm import Session
 from fastapi import Depends, APIRouter, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi import Depends, APIRouter, HTTPException, status
+from fastapi import Depends, APIRouter, HTTPException, Request, status, BackgroundTasks, Response
 from jose import jwt, JWTError
 
-from session import get_session
-from model import User, Item, Role
+from session import get_read_session, get_session
+from model import User, Item, Role, UserRole
 import auth
+import user_purge
+from http_cache import conditional_response
 from env import Environment
 from schemas import (
     UserResponseSchema,
@@ -19,13 +21,51 @@ from schemas import (
     ItemResponseSchema,
     ItemPostSchema,
     ItemPutSchema,
+    ItemBulkPostRequestSchema,
+    ItemBulkPutRequestSchema,
+    ItemBulkDeleteRequestSchema,
+    ItemBulkResultSchema,
+    ItemBulkResponseSchema,
+    PredictRequestSchema,
+    PredictResponseSchema,
+    PredictCacheStatsSchema,
 )
+from inference import MicroBatcher
+from prediction_cache import PredictionCache
 
 from permission_service import PermissionType
 
 
 router = APIRouter()
 
+
+def user_validator_rows(session: Session, page) -> List[tuple]:
+    """ユーザーのページの (id, updated, ロールのidの一覧) を1回のクエリで取得する
+    レスポンスにはロールも含まれるため、ロールの変更でもETagが変わるようにする
+    """
+    page = page.subquery()
+    rows = (
+        session.query(page.c.id, page.c.updated, UserRole.role_id)
+        .outerjoin(UserRole, UserRole.user_id == page.c.id)
+        .order_by(page.c.id, UserRole.role_id)
+    )
+    users = {}
+    for id, updated, role_id in rows:
+        role_ids = users.setdefault((id, updated), [])
+        if role_id is not None:
+            role_ids.append(role_id)
+    return [(id, updated, tuple(role_ids)) for (id, updated), role_ids in users.items()]
+
+
+def get_roles(session: Session, role_ids: List[int]) -> List[Role]:
+    """idからロールを1回のクエリでまとめて取得する。存在しないidがあれば404エラー"""
+    role_ids = list(dict.fromkeys(role_ids))
+    roles = {role.id: role for role in session.query(Role).filter(Role.id.in_(role_ids))}
+    for role_id in role_ids:
+        if role_id not in roles:
+            raise HTTPException(status_code=404, detail=f"Role is not found. (id={role_id})")
+    return [roles[role_id] for role_id in role_ids]
+
 # ユーザー作成
 @router.post("/users/", response_model=UserResponseSchema)
 def create_user(
@@ -39,47 +79,54 @@ def create_user(
     if user:
         raise HTTPException(status_code=400, detail=f"{data.username} is already exists.")
 
-    # idからロールを取得
-    roles = []
-    for role_id in data.role_ids:
-        role = session.query(Role).filter(Role.id == role_id).first()
-        if role is None:
-            raise HTTPException(status_code=404, detail=f"Role is not found. (id={role_id})")
-        roles.append(role)
-
     user = User(
         username=data.username,
         hashed_password=auth.hash(data.password),
         age=data.age,
-        roles=roles,
+        roles=get_roles(session, data.role_ids),
     )
     session.add(user)
+    # INSERT で採番された id はフラッシュ時に取得されるため、コミット前にレスポンスを作成しておく
+    # （コミット後に属性を参照すると、失効した属性を読み直す SELECT が発生する）
+    session.flush()
+    response = UserResponseSchema.model_validate(user)
     session.commit()
-    session.refresh(user)
-    return user
+    return response
 
 # ユーザー一覧
 @router.get("/users/", response_model=List[UserResponseSchema])
 def read_users(
+    request: Request,
+    response: Response,
     skip: int = 0,  # GETパラメータ
     limit: int = 100,  # GETパラメータ
-    session: Session = Depends(get_session),
-    _: User = Depends(auth.get_current_user([PermissionType.USER_READ]))
+    session: Session = Depends(get_read_session),
+    _: User = Depends(auth.get_current_read_user([PermissionType.USER_READ]))
 ):
-    users = session.query(User).offset(skip).limit(limit).all()
+    # ページ内の id と updated とロールだけを取得して、変更がなければ本文を読み込まずに304を返す
+    query = session.query(User).order_by(User.id).offset(skip).limit(limit)
+    not_modified = conditional_response(
+        request, response, user_validator_rows(session, query.with_entities(User.id, User.updated))
+    )
+    if not_modified:
+        return not_modified
+    users = query.all()
     return users
 
 # ユーザー取得
 @router.get("/users/{user_id}", response_model=UserResponseSchema)
 def read_user(
     user_id: int,
-    session: Session = Depends(get_session),
-    _: User = Depends(auth.get_current_user([PermissionType.USER_READ]))
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_read_session),
+    _: User = Depends(auth.get_current_read_user([PermissionType.USER_READ]))
 ):
     user = session.query(User).filter(User.id == user_id).first()
     if user is None:
         raise HTTPException(status_code=404, detail=f"User is not found. (id={user_id})")
-    return user
+    role_ids = tuple(sorted(role.id for role in user.roles))
+    return conditional_response(request, response, [(user.id, user.updated, role_ids)]) or user
 
 # ユーザー更新
 @router.put("/users/{user_id}", response_model=UserResponseSchema)
@@ -94,35 +141,34 @@ def update_user(
     if user is None:
         raise HTTPException(status_code=404, detail=f"User is not found. (id={user_id})")
 
-    # idからロールを取得
-    roles = []
-    for role_id in data.role_ids:
-        role = session.query(Role).filter(Role.id == role_id).first()
-        if role is None:
-            raise HTTPException(status_code=404, detail=f"Role is not found. (id={role_id})")
-        roles.append(role)
-
     # リクエストで受け取った password と age を設定して保存
     user.hashed_password = auth.hash(data.password)
     user.age = data.age
-    user.roles = roles
-    session.add(user)
+    user.roles = get_roles(session, data.role_ids)
+    session.flush()
+    response = UserResponseSchema.model_validate(user)
     session.commit()
-    session.refresh(user)
-    return user
+    return response
 
 # ユーザー削除
 @router.delete("/users/{user_id}")
 def delete_user(
     user_id: int,
+    response: Response,
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session),
     _: User = Depends(auth.get_current_user([PermissionType.USER_DELETE]))
 ):
-    # ユーザーの存在チェック。更新対象のユーザーが存在しなければ404エラー
-    user = session.query(User).filter(User.id == user_id).first()
-    if user is None:
+    env = Environment()
+    # アイテムが多いユーザーは、レスポンスを返した後にアイテムを少しずつ削除してからユーザーを削除する
+    if user_purge.has_more_items_than(session, user_id, env.user_purge_threshold):
+        background_tasks.add_task(user_purge.purge_user, session.get_bind(), user_id, env.user_purge_batch_size)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"user_id": user_id}
+
+    # アイテムとロールの割り当ては ON DELETE CASCADE で削除される。更新対象のユーザーが存在しなければ404エラー
+    if not user_purge.delete_user(session, user_id):
         raise HTTPException(status_code=404, detail=f"User is not found. (id={user_id})")
-    session.delete(user)
     session.commit()
     return {"user_id": user_id}
 
@@ -163,36 +209,146 @@ def create(
     session: Session = Depends(get_session),
     current_user: User = Depends(auth.get_current_user([PermissionType.ITEM_CREATE]))
 ):
-    item = Item(title=data.title, content=data.content)
-    current_user.items.append(item)
-    session.add(current_user)
+    # current_user.items に追加するとユーザーのアイテムをすべて読み込むため、user_id を指定して直接 INSERT する
+    item = Item(user_id=current_user.id, title=data.title, content=data.content)
+    session.add(item)
+    session.flush()
+    response = ItemResponseSchema.model_validate(item)
+    session.commit()
+    return response
+
+
+def check_bulk_size(count: int) -> None:
+    """一括操作の件数が上限を超えていれば413エラー"""
+    max_operations = Environment().item_bulk_max_operations
+    if count > max_operations:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Too many operations. ({count} > {max_operations})",
+        )
+
+
+def chunk_rows_by_size(rows: List[dict], max_bytes: int) -> List[List[dict]]:
+    """1回の INSERT の大きさが max_bytes（タイトルと本文のバイト数）を超えないように行を分ける
+    max_bytes より大きい行は、その行だけで1回の INSERT にする
+    """
+    chunks, chunk, size = [], [], 0
+    for row in rows:
+        row_size = len(row["title"].encode("utf-8")) + len((row["content"] or "").encode("utf-8"))
+        if chunk and size + row_size > max_bytes:
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(row)
+        size += row_size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def find_own_item_ids(session: Session, user_id: int, item_ids: List[int]) -> set:
+    """item_ids のうち、ユーザーが所有するアイテムのidを1回のクエリで取得し、処理が終わるまで行をロックする"""
+    statement = select(Item.id).where(and_(Item.id.in_(item_ids), Item.user_id == user_id)).with_for_update()
+    return set(session.scalars(statement))
+
+
+# アイテムの一括作成
+# 一括操作は /items/{item_id} より先に登録し、"bulk" がアイテムのidとして解釈されないようにする
+@router.post("/items/bulk", response_model=ItemBulkResponseSchema)
+def bulk_create(
+    data: ItemBulkPostRequestSchema,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(auth.get_current_user([PermissionType.ITEM_CREATE]))
+):
+    check_bulk_size(len(data.items))
+    rows = [{"user_id": current_user.id, "title": entry.title, "content": entry.content} for entry in data.items]
+    ids = []
+    # 大きな本文を含むリクエストでも max_allowed_packet を超えないよう、大きさで分けて INSERT する（同じトランザクション内）
+    for chunk in chunk_rows_by_size(rows, Environment().item_bulk_insert_max_bytes):
+        if session.get_bind().dialect.insert_executemany_returning:
+            # 複数行の INSERT ... RETURNING にまとめて採番されたidを受け取る。
+            # id は VALUES の行の順番に採番されるが、RETURNING の順番は保証されないため並べ替える
+            # （sort_by_parameter_order=True は SQLite では1行ずつの INSERT になる）
+            ids.extend(sorted(session.scalars(insert(Item).returning(Item.id), chunk)))
+        else:
+            # RETURNING が使えない MySQL では、1つの複数行 INSERT で追加する。
+            # lastrowid (LAST_INSERT_ID()) は最初の行のidで、残りの行には連続したidが採番される
+            # （auto_increment_increment が 1 の場合。env.py の item_bulk_insert_max_bytes を参照）
+            result = session.execute(insert(Item.__table__).values(chunk))
+            ids.extend(range(result.lastrowid, result.lastrowid + len(chunk)))
+    session.commit()
+    return {"results": [ItemBulkResultSchema(id=id, status=status.HTTP_200_OK) for id in ids]}
+
+
+# アイテムの一括更新
+@router.put("/items/bulk", response_model=ItemBulkResponseSchema)
+def bulk_update(
+    data: ItemBulkPutRequestSchema,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(auth.get_current_user([PermissionType.ITEM_UPDATE]))
+):
+    check_bulk_size(len(data.items))
+    own_ids = find_own_item_ids(session, current_user.id, [entry.id for entry in data.items])
+    rows = [entry.model_dump() for entry in data.items if entry.id in own_ids]
+    if rows:
+        # 主キーを含むパラメータのリストを渡すと、UPDATE ... WHERE id = ? を executemany で実行する
+        session.execute(sql_update(Item), rows)
     session.commit()
-    session.refresh(item)
-    return item
+    return {"results": [
+        ItemBulkResultSchema(id=entry.id, status=status.HTTP_200_OK) if entry.id in own_ids
+        else ItemBulkResultSchema(id=entry.id, status=status.HTTP_404_NOT_FOUND, detail="item not found")
+        for entry in data.items
+    ]}
+
+
+# アイテムの一括削除（DELETE はリクエストボディを受け取らないクライアントがあるため POST で受け付ける）
+@router.post("/items/bulk/delete", response_model=ItemBulkResponseSchema)
+def bulk_delete(
+    data: ItemBulkDeleteRequestSchema,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(auth.get_current_user([PermissionType.ITEM_DELETE]))
+):
+    check_bulk_size(len(data.ids))
+    own_ids = find_own_item_ids(session, current_user.id, data.ids)
+    if own_ids:
+        session.execute(sql_delete(Item).where(Item.id.in_(own_ids)).execution_options(synchronize_session=False))
+    session.commit()
+    return {"results": [
+        ItemBulkResultSchema(id=item_id, status=status.HTTP_200_OK) if item_id in own_ids
+        else ItemBulkResultSchema(id=item_id, status=status.HTTP_404_NOT_FOUND, detail="item not found")
+        for item_id in data.ids
+    ]}
 
 
 # アイテムの一覧
 @router.get("/items/", response_model=List[ItemResponseSchema])
 def get_list(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(auth.get_current_user([PermissionType.ITEM_READ]))
+    session: Session = Depends(get_read_session),
+    current_user: User = Depends(auth.get_current_read_user([PermissionType.ITEM_READ]))
 ):
-    items = session.query(Item).filter(Item.user_id == current_user.id).offset(skip).limit(limit).all()
+    query = session.query(Item).filter(Item.user_id == current_user.id).order_by(Item.id).offset(skip).limit(limit)
+    not_modified = conditional_response(request, response, query.with_entities(Item.id, Item.updated))
+    if not_modified:
+        return not_modified
+    items = query.all()
     return items
 
 # アイテムの取得
 @router.get("/items/{item_id}", response_model=ItemResponseSchema)
 def get_item(
     item_id: int,
-    session: Session = Depends(get_session),
-    _: User = Depends(auth.get_current_user([PermissionType.ITEM_READ]))
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_read_session),
+    _: User = Depends(auth.get_current_read_user([PermissionType.ITEM_READ]))
 ):
     item = session.query(Item).filter(Item.id == item_id).first()
     if item is None:
         raise HTTPException(status_code=404, detail=f"Item is not found. (id={item_id})")
-    return item
+    return conditional_response(request, response, [(item.id, item.updated)]) or item
 
 
 # アイテムの更新
@@ -203,19 +359,28 @@ def update(
     session: Session = Depends(get_session),
     current_user: User = Depends(auth.get_current_user([PermissionType.ITEM_UPDATE]))
 ):
-    item = session.query(Item).filter(and_(Item.id == item_id, Item.user_id == current_user.id)).first()
-    if item is None:
-        raise HTTPException(status_code=404, detail="item not found")
-
+    # 所有者の確認と更新を1回の UPDATE で行う
+    values = {"title": data.title, "content": data.content}
+    statement = (
+        sql_update(Item)
+        .where(and_(Item.id == item_id, Item.user_id == current_user.id))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
     try:
-        item.title = data.title
-        item.content = data.content
-        session.add(item)
-        session.commit()
-        session.refresh(item)
-        return item
+        if session.get_bind().dialect.update_returning:
+            row = session.execute(statement.returning(Item.id, Item.title, Item.content)).first()
+            response = ItemResponseSchema.model_validate(row) if row else None
+        else:
+            # RETURNING が使えない MySQL では、更新件数で存在を確認してリクエストの値から返す
+            result = session.execute(statement)
+            response = ItemResponseSchema(id=item_id, **values) if result.rowcount else None
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal Server Error")
+    if response is None:
+        raise HTTPException(status_code=404, detail="item not found")
+    session.commit()
+    return response
 
 # アイテムの削除
 @router.delete("/items/{item_id}")
@@ -232,4 +397,43 @@ def delete(
         session.commit()
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal Server Error")
-    return {"item_id": item_id}
\ No newline at end of file
+    return {"item_id": item_id}
+
+def get_batcher(request: Request) -> MicroBatcher:
+    """起動時に読み込んだ推論用のバッチャーを取得する"""
+    batcher = getattr(request.app.state, "batcher", None)
+    if batcher is None:
+        raise HTTPException(status_code=503, detail="Model is not loaded.")
+    return batcher
+
+def get_prediction_cache(request: Request) -> PredictionCache:
+    """起動時に作成した推論結果のキャッシュを取得する"""
+    return request.app.state.prediction_cache
+
+# 推論
+@router.post("/predict", response_model=PredictResponseSchema)
+async def predict(
+    data: PredictRequestSchema,
+    batcher: MicroBatcher = Depends(get_batcher),
+    cache: PredictionCache = Depends(get_prediction_cache),
+):
+    # 検証・キャッシュ・推論で同じモデルを使う（途中でモデルが差し替えられても特徴量の数がずれない）
+    model = batcher.model
+    if len(data.features) != model.n_features:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Expected {model.n_features} features, got {len(data.features)}.",
+        )
+    # 同じモデル・同じ特徴量の結果がキャッシュにあれば推論しない
+    cached = cache.get(model.version, data.features)
+    if cached is not None:
+        return cached
+    model_version, label, probabilities = await batcher.predict(data.features, model)
+    result = {"label": label, "probabilities": probabilities, "model_version": model_version}
+    cache.set(model_version, data.features, result)
+    return result
+
+# 推論結果キャッシュのメトリクス
+@router.get("/predict/stats", response_model=PredictCacheStatsSchema)
+def predict_stats(cache: PredictionCache = Depends(get_prediction_cache)):
+    return cache.stats()
@@ -42,4 +42,47 @@ class ItemPostSchema(BaseModel):
 
 class ItemPutSchema(BaseModel):
     title: str
-    content: str
\ No newline at end of file
+    content: str
+
+class ItemBulkPutSchema(BaseModel):
+    id: int
+    title: str
+    content: str
+
+class ItemBulkPostRequestSchema(BaseModel):
+    """アイテムの一括作成APIのリクエスト"""
+    items: List[ItemPostSchema]
+
+class ItemBulkPutRequestSchema(BaseModel):
+    """アイテムの一括更新APIのリクエスト"""
+    items: List[ItemBulkPutSchema]
+
+class ItemBulkDeleteRequestSchema(BaseModel):
+    """アイテムの一括削除APIのリクエスト"""
+    ids: List[int]
+
+class ItemBulkResultSchema(BaseModel):
+    """一括操作の1件ごとの結果（リクエストと同じ順番で返す）"""
+    id: Optional[int]
+    status: int
+    detail: Optional[str] = None
+
+class ItemBulkResponseSchema(BaseModel):
+    results: List[ItemBulkResultSchema]
+
+class PredictRequestSchema(BaseModel):
+    """推論APIのリクエスト（特徴量1件）"""
+    features: List[float]
+
+class PredictResponseSchema(BaseModel):
+    label: int
+    probabilities: List[float]
+    model_version: Optional[str]
+
+class PredictCacheStatsSchema(BaseModel):
+    hits: int
+    misses: int
+    hit_rate: float
+    size: int
+    maxsize: int
+    ttl: float
@@ -0,0 +1,155 @@
+import os
+from typing import Optional
+
+import click
+import joblib
+import numpy as np
+from sklearn.datasets import load_iris
+from sklearn.linear_model import LogisticRegression
+from skl2onnx import to_onnx
+
+from inference import OnnxModel
+from batch_predict import DEFAULT_CHUNK_SIZE, predict_file
+from incremental_train import (
+    DEFAULT_CHECKPOINT_EVERY, DEFAULT_EPOCHS, DEFAULT_TRAIN_CHUNK_SIZE, IncrementalTrainer, file_chunks, query_chunks,
+)
+from model_registry import ModelRegistry
+
+# 学習済みモデルの保存先（api ディレクトリからの相対パス）
+MODEL_DIR = "../model"
+SKLEARN_MODEL_FILE = "model.joblib"
+# 大規模データの学習を中断・再開するためのチェックポイント
+CHECKPOINT_FILE = "train_checkpoint.joblib"
+# ONNXモデルはバージョンごとにレジストリへ登録する
+REGISTRY_DIR = "registry"
+
+
+def get_registry(model_dir: str) -> ModelRegistry:
+    return ModelRegistry(os.path.join(model_dir, REGISTRY_DIR))
+
+
+def current_onnx_path(model_dir: str) -> str:
+    """レジストリで有効なバージョンのONNXモデルのパスを返す"""
+    registry = get_registry(model_dir)
+    version = registry.current_version()
+    if version is None:
+        raise click.ClickException("No ONNX model is registered. Run with --convert first.")
+    return registry.model_path(version)
+
+
+def fit_reference_model() -> LogisticRegression:
+    """irisデータセットで基準となる分類モデルを学習する"""
+    X, y = load_iris(return_X_y=True)
+    model = LogisticRegression(max_iter=500)
+    model.fit(X, y)
+    return model
+
+
+def to_onnx_bytes(model) -> bytes:
+    """scikit-learnのモデルをONNX形式に変換する
+    バッチ推論で扱いやすいよう、確率は辞書(ZipMap)ではなくテンソルで出力する
+    """
+    sample = np.zeros((1, model.n_features_in_), dtype=np.float32)
+    return to_onnx(model, sample, options={id(model): {"zipmap": False}}).SerializeToString()
+
+
+def train(model_dir: str) -> None:
+    """分類モデルを学習し、joblib形式で保存する"""
+    model = fit_reference_model()
+    os.makedirs(model_dir, exist_ok=True)
+    joblib.dump(model, os.path.join(model_dir, SKLEARN_MODEL_FILE))
+
+
+def train_incremental(model_dir: str, source, epochs: int, checkpoint_every: int) -> None:
+    """データをチャンク単位で読み込みながら学習し、joblib形式で保存する
+    中断した場合は同じコマンドを再実行すると、チェックポイントから学習を再開する
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    checkpoint_path = os.path.join(model_dir, CHECKPOINT_FILE)
+    trainer = IncrementalTrainer(checkpoint_path=checkpoint_path, checkpoint_every=checkpoint_every)
+    model = trainer.fit(source, epochs=epochs)
+    joblib.dump(model, os.path.join(model_dir, SKLEARN_MODEL_FILE))
+    os.remove(checkpoint_path)
+    click.echo(f"trained {epochs} epochs, classes: {trainer.classes.tolist()}")
+
+
+def convert(model_dir: str, metadata: Optional[dict] = None) -> None:
+    """学習済みモデルをONNX形式に変換し、新しいバージョンとしてレジストリに登録する
+    :param metadata: レジストリのメタデータに追加で記録する情報（学習時のパラメータなど）
+    """
+    model = joblib.load(os.path.join(model_dir, SKLEARN_MODEL_FILE))
+    version = get_registry(model_dir).publish(
+        to_onnx_bytes(model),
+        {"estimator": type(model).__name__, "n_features": int(model.n_features_in_), **(metadata or {})},
+    )
+    click.echo(f"registered {version}")
+
+
+def predict(model_dir: str, features: str) -> None:
+    """カンマ区切りの特徴量1件をONNXモデルで推論する"""
+    model = OnnxModel(current_onnx_path(model_dir))
+    x = np.array([[float(v) for v in features.split(",")]], dtype=np.float32)
+    labels, probabilities = model.predict(x)
+    click.echo(f"label: {int(labels[0])}, probabilities: {probabilities[0].tolist()}")
+
+
+def predict_batch(model_dir: str, input_path: str, output_path: str, chunk_size: int, workers: int, columns) -> None:
+    """CSV/Parquetファイルの全行をチャンク単位でまとめて推論する"""
+    rows = predict_file(
+        current_onnx_path(model_dir),
+        input_path,
+        output_path,
+        chunk_size=chunk_size,
+        workers=workers,
+        columns=columns.split(",") if columns else None,
+    )
+    click.echo(f"{rows} rows -> {output_path}")
+
+
+@click.command()
+@click.option("--train", "do_train", is_flag=True, help="モデルを学習する")
+@click.option("--train-file", "train_path", type=click.Path(exists=True, dir_okay=False),
+              help="CSV/Parquetファイルをチャンク単位で読み込み、partial_fit で学習する")
+@click.option("--train-query", default=None, help="SQLの結果をサーバーサイドカーソルで読み込み、partial_fit で学習する")
+@click.option("--db-url", envvar="DB_URL", default=None, help="--train-query の接続先（省略時は環境変数 DB_URL）")
+@click.option("--label-column", default="label", show_default=True, help="学習データのラベル列")
+@click.option("--train-chunk-size", default=DEFAULT_TRAIN_CHUNK_SIZE, show_default=True, help="学習時に1回に読み込む行数")
+@click.option("--epochs", default=DEFAULT_EPOCHS, show_default=True, help="学習データを走査する回数")
+@click.option("--checkpoint-every", default=DEFAULT_CHECKPOINT_EVERY, show_default=True,
+              help="何チャンクごとにチェックポイントを保存するか")
+@click.option("--convert", "do_convert", is_flag=True, help="学習済みモデルをONNX形式に変換する")
+@click.option("--predict", "features", type=str, help='カンマ区切りの特徴量 (例: "5.1,3.5,1.4,0.2")')
+@click.option("--predict-file", "input_path", type=click.Path(exists=True, dir_okay=False),
+              help="CSV/Parquetファイルの全行を推論する")
+@click.option("--output", "output_path", default="predictions.parquet", show_default=True,
+              help="--predict-file の出力先 (.csv / .parquet)")
+@click.option("--chunk-size", default=DEFAULT_CHUNK_SIZE, show_default=True, help="1回に読み込み・推論する行数")
+@click.option("--workers", default=1, show_default=True, help="チャンクを並列に推論するプロセス数")
+@click.option("--columns", default=None, help="特徴量として使う列名（カンマ区切り）。省略時は全列（学習時はラベル列以外）")
+@click.option("--activate", "version", default=None, help="有効なモデルのバージョンを切り替える (例: v1)")
+@click.option("--model-dir", default=MODEL_DIR, show_default=True, help="モデルの保存先ディレクトリ")
+def cli(do_train, train_path, train_query, db_url, label_column, train_chunk_size, epochs, checkpoint_every,
+        do_convert, features, input_path, output_path, chunk_size, workers, columns, version, model_dir):
+    feature_columns = columns.split(",") if columns else None
+    if do_train:
+        train(model_dir)
+    if train_path:
+        source = file_chunks(train_path, train_chunk_size, label_column, feature_columns)
+        train_incremental(model_dir, source, epochs, checkpoint_every)
+    if train_query:
+        if not db_url:
+            raise click.ClickException("--db-url or DB_URL is required for --train-query.")
+        source = query_chunks(db_url, train_query, train_chunk_size, label_column, feature_columns)
+        train_incremental(model_dir, source, epochs, checkpoint_every)
+    if do_convert:
+        convert(model_dir)
+    if version:
+        get_registry(model_dir).activate(version)
+    if features:
+        predict(model_dir, features)
+    if input_path:
+        predict_batch(model_dir, input_path, output_path, chunk_size, workers, columns)
+
+
+if __name__ == "__main__":
+    cli()
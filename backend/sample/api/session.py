@@ -1,5 +1,13 @@
+import itertools
+import threading
+import time
+from typing import Dict, List
+
+from fastapi import Request, Response
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
 
 from env import Environment  # 環境変数設定のためのクラスを読み込み
 
@@ -9,6 +17,10 @@ SQLALCHEMY_DATABASE_URL = env.db_url
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=True, bind=engine)
 
+# 書き込み直後の読み取りをプライマリに送る期間を記録するCookieと、常にプライマリから読むためのヘッダ
+READ_PRIMARY_COOKIE = "read_primary_until"
+READ_PRIMARY_HEADER = "X-Read-Primary"
+
 def get_session():
     """Generate a new database session.
     This session is designed for a single request and will automatically close
@@ -18,4 +30,84 @@ def get_session():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+class ReplicaRouter:
+    """読み取り用の接続をレプリカにラウンドロビンで振り分ける
+    接続できなかったレプリカは retry_interval 秒間振り分け先から外し、
+    使えるレプリカがない場合はプライマリに接続する。
+    """
+
+    def __init__(self, primary: Engine, replicas: List[Engine], retry_interval: float = 30.0):
+        self.primary = primary
+        self.replicas = replicas
+        self.retry_interval = retry_interval
+        self._counter = itertools.count()
+        self._down_until: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def is_available(self, index: int) -> bool:
+        with self._lock:
+            return self._down_until.get(index, 0.0) <= time.monotonic()
+
+    def mark_down(self, index: int) -> None:
+        with self._lock:
+            self._down_until[index] = time.monotonic() + self.retry_interval
+
+    def connect(self) -> Connection:
+        """読み取り用の接続を返す（レプリカがなければプライマリ）"""
+        if self.replicas:
+            start = next(self._counter)
+            for offset in range(len(self.replicas)):
+                index = (start + offset) % len(self.replicas)
+                if not self.is_available(index):
+                    continue
+                try:
+                    # pool_pre_ping により、切断されたプール内の接続もここで検出される
+                    return self.replicas[index].connect()
+                except OperationalError as e:
+                    print(f"Read replica {index} is unavailable, retrying in {self.retry_interval}s: {e}")
+                    self.mark_down(index)
+        return self.primary.connect()
+
+
+replica_engines = [
+    create_engine(url.strip(), pool_pre_ping=True)
+    for url in env.db_replica_urls.split(",") if url.strip()
+]
+replica_router = ReplicaRouter(engine, replica_engines, env.db_replica_retry_interval)
+
+
+def reads_from_primary(request: Request) -> bool:
+    """書き込み直後（read-your-writes）や明示的に指定された場合はプライマリから読む"""
+    if request.headers.get(READ_PRIMARY_HEADER, "").lower() in ("1", "true"):
+        return True
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def mark_read_primary(response: Response) -> None:
+    """書き込みに成功したレスポンスに、しばらくプライマリから読むためのCookieを付ける"""
+    until = time.time() + env.read_your_writes_seconds
+    response.set_cookie(READ_PRIMARY_COOKIE, f"{until:.3f}",
+                        max_age=int(env.read_your_writes_seconds) + 1, httponly=True, samesite="lax")
+
+
+def get_read_session(request: Request):
+    """Generate a read-only session for GET endpoints.
+    The session is bound to a replica connection chosen by replica_router, or to the
+    primary when no replica is configured or the client has just written.
+    """
+    if not replica_engines or reads_from_primary(request):
+        yield from get_session()
+        return
+    connection = replica_router.connect()
+    db = Session(bind=connection, autoflush=False)
+    try:
+        yield db
+    finally:
+        db.close()
+        connection.close()
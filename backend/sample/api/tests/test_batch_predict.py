@@ -0,0 +1,27 @@
+import sys
+sys.path.append("/opt/app/api")
+
+import numpy as np
+import pandas as pd
+
+from batch_predict import iter_chunks
+
+
+def write_features(tmp_path):
+    # ヘッダの順番が --columns の順番と異なるファイル
+    frame = pd.DataFrame({"f2": [2.0, 12.0], "label": [0, 1], "f0": [0.0, 10.0], "f1": [1.0, 11.0]})
+    csv_path = tmp_path / "features.csv"
+    parquet_path = tmp_path / "features.parquet"
+    frame.to_csv(csv_path, index=False)
+    frame.to_parquet(parquet_path, index=False)
+    return csv_path, parquet_path
+
+
+def test_iter_chunks_follows_column_order(tmp_path):
+    """
+    ファイル内の列の順番に関係なく、指定した columns の順番で特徴量を読み込むことを確認する
+    """
+    expected = np.array([[0.0, 1.0, 2.0], [10.0, 11.0, 12.0]], dtype=np.float32)
+    for path in write_features(tmp_path):
+        chunks = list(iter_chunks(str(path), 1, ["f0", "f1", "f2"]))
+        np.testing.assert_array_equal(np.vstack(chunks), expected)
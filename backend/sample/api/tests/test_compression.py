@@ -0,0 +1,113 @@
+import sys
+sys.path.append("/opt/app/api")
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+import compression
+from compression import (
+    CompressionMiddleware,
+    PrecompressedStaticFiles,
+    negotiate_encoding,
+    precompress_directory,
+)
+
+
+def make_client(static_dir) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100, content_types=["application/json"], encodings=["gzip"])
+
+    @app.get("/large")
+    def large():
+        return [{"id": i, "title": "タイトル"} for i in range(100)]
+
+    @app.get("/small")
+    def small():
+        return {"id": 1}
+
+    @app.get("/text")
+    def text():
+        return PlainTextResponse("a" * 1000)
+
+    app.mount("/", PrecompressedStaticFiles(directory=str(static_dir), immutable_prefixes=["_nuxt/"]), name="static")
+    return TestClient(app)
+
+
+def test_negotiate_encoding():
+    """
+    q 値が大きい方式を選び、同じ q 値ならサーバーの優先順で選ぶ
+    """
+    assert negotiate_encoding("gzip, br", ["zstd", "br", "gzip"]) == "br"
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.5", ["br", "gzip"]) == "gzip"
+    assert negotiate_encoding("br;q=0, *", ["br", "gzip"]) == "gzip"
+    assert negotiate_encoding("identity", ["br", "gzip"]) is None
+
+
+def test_compress_response(tmp_path):
+    """
+    minimum_size 以上で、対象の Content-Type のレスポンスだけを圧縮する
+    """
+    client = make_client(tmp_path)
+
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert len(response.json()) == 100
+
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    response = client.get("/text", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_precompressed_static_files(tmp_path):
+    """
+    ビルド時に作成した .gz を返し、ハッシュ付きのファイルには immutable の Cache-Control を付ける
+    """
+    (tmp_path / "_nuxt").mkdir()
+    (tmp_path / "_nuxt" / "entry.B1n3kz9d.js").write_text("console.log('hello');\n" * 100)
+    (tmp_path / "index.html").write_text("<html></html>")
+    created = precompress_directory(str(tmp_path), 100, ["text/javascript", "application/javascript", "text/html"])
+    # 小さいファイルは圧縮しない。.br は brotli がインストールされている場合だけ作成する
+    expected = [str(tmp_path / "_nuxt" / "entry.B1n3kz9d.js.gz")]
+    if compression.brotli is not None:
+        expected.append(str(tmp_path / "_nuxt" / "entry.B1n3kz9d.js.br"))
+    assert created == expected
+    # 2回目は作成済みのファイルを作り直さない
+    assert precompress_directory(str(tmp_path), 100, ["text/javascript", "application/javascript"]) == []
+
+    client = make_client(tmp_path)
+    response = client.get("/_nuxt/entry.B1n3kz9d.js", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Content-Type"].split(";")[0] in ("text/javascript", "application/javascript")
+    assert response.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert response.text.startswith("console.log")
+
+    response = client.get("/_nuxt/entry.B1n3kz9d.js", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    response = client.get("/index.html", headers={"Accept-Encoding": "gzip"})
+    assert "Cache-Control" not in response.headers
+
+
+def test_precompressed_static_files_brotli(tmp_path):
+    """
+    .br と .gz の両方がある場合、Accept-Encoding: br には .br を返す
+    """
+    (tmp_path / "_nuxt").mkdir()
+    (tmp_path / "_nuxt" / "entry.B1n3kz9d.js").write_text("console.log('hello');\n" * 100)
+    # brotli がインストールされていなくても配信を確認できるよう、中身は圧縮データとして扱うだけのバイト列にする
+    (tmp_path / "_nuxt" / "entry.B1n3kz9d.js.br").write_bytes(b"brotli")
+    (tmp_path / "_nuxt" / "entry.B1n3kz9d.js.gz").write_bytes(b"gzip")
+
+    client = make_client(tmp_path)
+    for accept_encoding, encoding, body in [("br", "br", b"brotli"), ("gzip, br", "br", b"brotli"), ("gzip", "gzip", b"gzip")]:
+        # 本文はクライアントに展開させず、配信されたファイルのバイト列をそのまま比較する
+        with client.stream("GET", "/_nuxt/entry.B1n3kz9d.js", headers={"Accept-Encoding": accept_encoding}) as response:
+            assert response.status_code == 200
+            assert response.headers["Content-Encoding"] == encoding
+            assert response.headers["Vary"] == "Accept-Encoding"
+            assert b"".join(response.iter_raw()) == body
@@ -0,0 +1,56 @@
+import sys
+sys.path.append("/opt/app/api")
+
+import numpy as np
+import pandas as pd
+from sklearn.datasets import load_iris
+
+from incremental_train import IncrementalTrainer, file_chunks
+
+
+def write_iris_csv(path):
+    X, y = load_iris(return_X_y=True)
+    frame = pd.DataFrame(X, columns=["f0", "f1", "f2", "f3"])
+    frame["label"] = y
+    # partial_fit が偏ったチャンクだけを学習しないよう、行を混ぜておく
+    frame.sample(frac=1, random_state=0).to_csv(path, index=False)
+    return X, y
+
+
+def test_incremental_trainer_learns_from_chunks(tmp_path):
+    """
+    チャンク単位の学習で、全データを一度に読み込まずに分類器を学習できることを確認する
+    """
+    path = tmp_path / "iris.csv"
+    X, y = write_iris_csv(path)
+
+    model = IncrementalTrainer().fit(file_chunks(str(path), 30, "label"), epochs=10)
+
+    assert model.n_features_in_ == 4
+    assert (model.predict(X.astype(np.float32)) == y).mean() > 0.8
+
+
+def test_incremental_trainer_resumes_from_checkpoint(tmp_path):
+    """
+    チェックポイントが残っている場合、保存済みのエポックとチャンクを読み飛ばして再開することを確認する
+    """
+    path = tmp_path / "iris.csv"
+    write_iris_csv(path)
+    checkpoint_path = str(tmp_path / "checkpoint.joblib")
+    source = file_chunks(str(path), 30, "label")
+
+    IncrementalTrainer(checkpoint_path=checkpoint_path, checkpoint_every=1).fit(source, epochs=1)
+
+    read_chunks = []
+
+    def counting_source():
+        for chunk in source():
+            read_chunks.append(chunk)
+            yield chunk
+
+    trainer = IncrementalTrainer(checkpoint_path=checkpoint_path)
+    trainer.fit(counting_source, epochs=2)
+
+    # 統計量の集計と1エポック目は再実行されず、2エポック目の走査だけが行われる
+    assert trainer.epoch == 2
+    assert len(read_chunks) == 5
@@ -0,0 +1,103 @@
+import sys
+sys.path.append("/opt/app/api")
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from inference import MicroBatcher
+from prediction_cache import PredictionCache
+
+
+class FakeModel:
+    """特徴量の先頭の値をラベルとして返すテスト用モデル"""
+    n_features = 2
+    version = "v1"
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, features):
+        self.batch_sizes.append(len(features))
+        labels = features[:, 0].astype(np.int64)
+        probabilities = np.full((len(features), 2), 0.5, dtype=np.float32)
+        return labels, probabilities
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_coalesces_concurrent_requests():
+    """
+    同時に届いたリクエストは1回の推論にまとめられ、それぞれに自分の結果が返ります
+    """
+    model = FakeModel()
+    batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=50)
+    batcher.start()
+    try:
+        results = await asyncio.gather(*[batcher.predict([i, 0]) for i in range(8)])
+    finally:
+        await batcher.stop()
+    assert [label for _, label, _ in results] == list(range(8))
+    assert model.batch_sizes == [8]
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_splits_by_max_batch_size():
+    """
+    max_batch_size を超えるリクエストは複数のバッチに分割されます
+    """
+    model = FakeModel()
+    batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=50)
+    batcher.start()
+    try:
+        await asyncio.gather(*[batcher.predict([i, 0]) for i in range(10)])
+    finally:
+        await batcher.stop()
+    assert model.batch_sizes == [4, 4, 2]
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_uses_model_of_each_request():
+    """
+    待機中にモデルが差し替えられても、各リクエストは指定したモデルで推論されます
+    """
+    old_model, new_model = FakeModel(), FakeModel()
+    new_model.version = "v2"
+    batcher = MicroBatcher(old_model, max_batch_size=8, max_wait_ms=50)
+    batcher.start()
+    try:
+        pending = asyncio.ensure_future(batcher.predict([1, 0], old_model))
+        await asyncio.sleep(0)
+        batcher.model = new_model
+        results = await asyncio.gather(pending, batcher.predict([2, 0]))
+    finally:
+        await batcher.stop()
+    assert [(version, label) for version, label, _ in results] == [("v1", 1), ("v2", 2)]
+    assert old_model.batch_sizes == [1]
+    assert new_model.batch_sizes == [1]
+
+
+def test_prediction_cache_hits_on_quantized_features():
+    """
+    丸めると同じになる特徴量はキャッシュにヒットし、モデルのバージョンが違えばヒットしません
+    """
+    cache = PredictionCache(maxsize=10, ttl=60, decimals=2)
+    cache.set("v1", [5.1, 3.5], {"label": 0})
+    assert cache.get("v1", [5.1001, 3.4999]) == {"label": 0}
+    assert cache.get("v2", [5.1, 3.5]) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_prediction_cache_evicts_least_recently_used():
+    """
+    件数の上限を超えると、最も古く使われた結果から破棄されます
+    """
+    cache = PredictionCache(maxsize=2, ttl=60)
+    cache.set("v1", [1.0], 1)
+    cache.set("v1", [2.0], 2)
+    cache.get("v1", [1.0])
+    cache.set("v1", [3.0], 3)
+    assert cache.get("v1", [2.0]) is None
+    assert cache.get("v1", [1.0]) == 1
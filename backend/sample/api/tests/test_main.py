@@ -3,17 +3,44 @@ import pprint
 pprint.pprint(sys.path)
 sys.path.append("/opt/app/api")
 
+from contextlib import contextmanager
+from datetime import timedelta
+from email.utils import format_datetime, parsedate_to_datetime
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 
-from session import get_session
-from model import Base, RoleType, Role
+from session import get_read_session, get_session
+from model import Base, RoleType, Role, UserRole
 from main import app
 from env import Environment
 from tests.lib import create_user, fetch_token
 
+@contextmanager
+def record_statements():
+    """実行されたSQLとコミットを順番に記録する"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def commit(conn):
+        statements.append("COMMIT")
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(Engine, "commit", commit)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+        event.remove(Engine, "commit", commit)
+
+def item_statements(statements):
+    return [statement for statement in statements if "items" in statement]
+
 @pytest.fixture
 def client() -> TestClient:
     # セッションファクトリーの作成
@@ -35,6 +62,7 @@ def client() -> TestClient:
             session.close()
 
     app.dependency_overrides[get_session] = get_test_session
+    app.dependency_overrides[get_read_session] = get_test_session
 
     # テスト用のロールとユーザーを作成
     with TestSessionFactory() as session:
@@ -196,3 +224,315 @@ def test_item_delete(client):
         headers={"Authorization": f"Bearer {token}"},
     )
     assert response.status_code == 200
+
+def test_item_post_single_round_trip(client):
+    """
+    アイテムの作成は INSERT 1回とコミットだけで行い、ユーザーのアイテムの読み込みやコミット後の SELECT をしない
+    """
+    token = fetch_token(client, "sys_admin", "password")
+    with record_statements() as statements:
+        response = client.post(
+            "/api/v1/items/",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"title": "タイトル", "content": "本文"},
+        )
+    assert response.status_code == 200
+    assert response.json()["title"] == "タイトル"
+    assert [statement.split()[0] for statement in item_statements(statements)] == ["INSERT"]
+    assert statements[-1] == "COMMIT"
+
+def test_item_update_single_round_trip(client):
+    """
+    アイテムの更新は UPDATE 1回とコミットだけで行い、他のユーザーのアイテムは404になる
+    """
+    token = fetch_token(client, "sys_admin", "password")
+    response = client.post(
+        "/api/v1/items/",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"title": "タイトル", "content": "本文"},
+    )
+    id = response.json()["id"]
+    with record_statements() as statements:
+        response = client.put(
+            f"/api/v1/items/{id}",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"title": "タイトル1", "content": "本文2"},
+        )
+    assert response.status_code == 200
+    assert response.json() == {"id": id, "title": "タイトル1", "content": "本文2"}
+    assert [statement.split()[0] for statement in item_statements(statements)] == ["UPDATE"]
+    assert statements[-1] == "COMMIT"
+
+    token = fetch_token(client, "loc_admin", "password")
+    response = client.put(
+        f"/api/v1/items/{id}",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"title": "タイトル2", "content": "本文3"},
+    )
+    assert response.status_code == 404
+
+def test_user_create_without_refresh(client):
+    """
+    ユーザーの作成では、ロールを1回のクエリで取得し、コミット後に SELECT をしない
+    """
+    token = fetch_token(client, "sys_admin", "password")
+    with record_statements() as statements:
+        response = client.post(
+            "/api/v1/users/",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"username": "test", "password": "password", "age": 30, "role_ids": [1, 2]},
+        )
+    assert response.status_code == 200
+    assert [role["id"] for role in response.json()["roles"]] == [1, 2]
+    assert len([statement for statement in statements if "roles.id IN" in statement]) == 1
+    assert statements[-1] == "COMMIT"
+
+def test_user_delete_in_background(client, monkeypatch):
+    """
+    アイテムが閾値より多いユーザーは202を返し、バックグラウンドでアイテムごと削除される
+    """
+    monkeypatch.setenv("USER_PURGE_THRESHOLD", "1")
+    monkeypatch.setenv("USER_PURGE_BATCH_SIZE", "1")
+    token = fetch_token(client, "loc_admin", "password")
+    for i in range(3):
+        client.post(
+            "/api/v1/items/",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"title": f"タイトル{i}", "content": "本文"},
+        )
+
+    token = fetch_token(client, "sys_admin", "password")
+    response = client.delete(
+        "/api/v1/users/2",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 202
+    # TestClient はレスポンスを返す前にバックグラウンドタスクを実行する
+    response = client.get(
+        "/api/v1/users/2",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 404
+
+def test_item_bulk(client):
+    """
+    アイテムを一括で作成・更新・削除でき、他のユーザーのアイテムは1件ごとに404になる
+    """
+    token = fetch_token(client, "loc_admin", "password")
+    response = client.post(
+        "/api/v1/items/bulk",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"items": [{"title": "他のユーザー", "content": "本文"}]},
+    )
+    other_id = response.json()["results"][0]["id"]
+
+    token = fetch_token(client, "sys_admin", "password")
+    with record_statements() as statements:
+        response = client.post(
+            "/api/v1/items/bulk",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"items": [{"title": f"タイトル{i}", "content": "本文"} for i in range(3)]},
+        )
+    assert response.status_code == 200
+    ids = [result["id"] for result in response.json()["results"]]
+    assert len(set(ids)) == 3
+    # 本文の合計が ITEM_BULK_INSERT_MAX_BYTES 以下なら、件数に関係なく1回の INSERT とコミットで追加する
+    assert [statement.split()[0] for statement in item_statements(statements)] == ["INSERT"]
+    assert statements[-1] == "COMMIT"
+
+    response = client.put(
+        "/api/v1/items/bulk",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"items": [{"id": id, "title": "更新", "content": "本文2"} for id in ids[:2] + [other_id]]},
+    )
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["results"]] == [200, 200, 404]
+    response = client.get(f"/api/v1/items/{ids[0]}", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["title"] == "更新"
+
+    response = client.post(
+        "/api/v1/items/bulk/delete",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"ids": ids + [other_id]},
+    )
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["results"]] == [200, 200, 200, 404]
+    response = client.get(f"/api/v1/items/{other_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+def test_item_bulk_create_split_by_size(client, monkeypatch):
+    """
+    本文の合計が ITEM_BULK_INSERT_MAX_BYTES を超える一括作成は、複数の INSERT に分けて1回のコミットで追加する
+    """
+    monkeypatch.setenv("ITEM_BULK_INSERT_MAX_BYTES", "100")
+    token = fetch_token(client, "sys_admin", "password")
+    items = [{"title": f"title{i}", "content": "a" * 40} for i in range(5)]
+    with record_statements() as statements:
+        response = client.post("/api/v1/items/bulk", headers={"Authorization": f"Bearer {token}"}, json={"items": items})
+    assert response.status_code == 200
+    # 1行あたり46バイトのため、2行ずつに分けられる
+    assert [statement.split()[0] for statement in item_statements(statements)] == ["INSERT"] * 3
+    assert statements.count("COMMIT") == 1
+
+    ids = [result["id"] for result in response.json()["results"]]
+    assert len(set(ids)) == 5
+    for id, item in zip(ids, items):
+        response = client.get(f"/api/v1/items/{id}", headers={"Authorization": f"Bearer {token}"})
+        assert response.json()["title"] == item["title"]
+
+def test_item_bulk_too_many(client, monkeypatch):
+    """
+    上限を超える件数の一括操作は413になる
+    """
+    monkeypatch.setenv("ITEM_BULK_MAX_OPERATIONS", "2")
+    token = fetch_token(client, "sys_admin", "password")
+    response = client.post(
+        "/api/v1/items/bulk",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"items": [{"title": "タイトル", "content": "本文"}] * 3},
+    )
+    assert response.status_code == 413
+
+def test_item_get_not_modified(client):
+    """
+    ETag / Last-Modified が一致する場合は304を返し、一致しない場合は本文を返す
+    """
+    token = fetch_token(client, "sys_admin", "password")
+    response = client.post(
+        "/api/v1/items/",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"title": "タイトル", "content": "本文"},
+    )
+    id = response.json()["id"]
+    response = client.get(f"/api/v1/items/{id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    last_modified = response.headers["Last-Modified"]
+
+    response = client.get(
+        f"/api/v1/items/{id}",
+        headers={"Authorization": f"Bearer {token}", "If-None-Match": etag},
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+    response = client.get(
+        f"/api/v1/items/{id}",
+        headers={"Authorization": f"Bearer {token}", "If-None-Match": 'W/"other"'},
+    )
+    assert response.status_code == 200
+    # 受け取った Last-Modified をそのまま送り返せば304を返す（更新日時の秒未満は比較しない）
+    response = client.get(
+        f"/api/v1/items/{id}",
+        headers={"Authorization": f"Bearer {token}", "If-Modified-Since": last_modified},
+    )
+    assert response.status_code == 304
+    next_second = format_datetime(parsedate_to_datetime(last_modified) + timedelta(seconds=1), usegmt=True)
+    response = client.get(
+        f"/api/v1/items/{id}",
+        headers={"Authorization": f"Bearer {token}", "If-Modified-Since": next_second},
+    )
+    assert response.status_code == 304
+    response = client.get(
+        f"/api/v1/items/{id}",
+        headers={"Authorization": f"Bearer {token}", "If-Modified-Since": "Thu, 01 Jan 2015 00:00:00 GMT"},
+    )
+    assert response.status_code == 200
+
+def test_item_list_not_modified(client):
+    """
+    一覧はページ内のアイテムが変わらなければ304を返し、アイテムが追加されると本文を返す
+    """
+    token = fetch_token(client, "sys_admin", "password")
+    client.post(
+        "/api/v1/items/",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"title": "タイトル", "content": "本文"},
+    )
+    response = client.get("/api/v1/items/", headers={"Authorization": f"Bearer {token}"})
+    etag = response.headers["ETag"]
+    last_modified = response.headers["Last-Modified"]
+    response = client.get("/api/v1/items/", headers={"Authorization": f"Bearer {token}", "If-None-Match": etag})
+    assert response.status_code == 304
+    response = client.get(
+        "/api/v1/items/", headers={"Authorization": f"Bearer {token}", "If-Modified-Since": last_modified}
+    )
+    assert response.status_code == 304
+
+    client.post(
+        "/api/v1/items/",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"title": "タイトル2", "content": "本文"},
+    )
+    response = client.get("/api/v1/items/", headers={"Authorization": f"Bearer {token}", "If-None-Match": etag})
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+
+def test_item_get_modified_in_same_second(client):
+    """
+    同じ秒のうちに更新されても、更新前のETagでは304にならない
+    """
+    token = fetch_token(client, "sys_admin", "password")
+    response = client.post(
+        "/api/v1/items/",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"title": "タイトル", "content": "本文"},
+    )
+    id = response.json()["id"]
+    etag = client.get(f"/api/v1/items/{id}", headers={"Authorization": f"Bearer {token}"}).headers["ETag"]
+    client.put(
+        f"/api/v1/items/{id}",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"title": "タイトル1", "content": "本文2"},
+    )
+    response = client.get(f"/api/v1/items/{id}", headers={"Authorization": f"Bearer {token}", "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["title"] == "タイトル1"
+
+def test_user_get_etag_covers_roles(client):
+    """
+    ユーザーのETagはロールの割り当ても含む
+    """
+    token = fetch_token(client, "sys_admin", "password")
+    response = client.get("/api/v1/users/3", headers={"Authorization": f"Bearer {token}"})
+    etag = response.headers["ETag"]
+    list_etag = client.get("/api/v1/users/", headers={"Authorization": f"Bearer {token}"}).headers["ETag"]
+    assert client.get(
+        "/api/v1/users/3", headers={"Authorization": f"Bearer {token}", "If-None-Match": etag}
+    ).status_code == 304
+
+    # テスト用DBのセッションで、updated を変えずにロールの割り当てだけを変更する
+    sessions = app.dependency_overrides[get_session]()
+    session = next(sessions)
+    session.add(UserRole(user_id=3, role_id=2))
+    session.commit()
+    sessions.close()
+    response = client.get("/api/v1/users/3", headers={"Authorization": f"Bearer {token}", "If-None-Match": etag})
+    assert response.status_code == 200
+    assert sorted(role["id"] for role in response.json()["roles"]) == [2, 3]
+    response = client.get("/api/v1/users/", headers={"Authorization": f"Bearer {token}", "If-None-Match": list_etag})
+    assert response.status_code == 200
+
+def test_read_endpoints_do_not_use_primary(client):
+    """
+    GETのエンドポイントは認証のユーザー取得も読み取り用のセッション（レプリカ）で行い、プライマリのセッションを使わない
+    """
+    token = fetch_token(client, "sys_admin", "password")
+    id = client.post(
+        "/api/v1/items/",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"title": "タイトル", "content": "本文"},
+    ).json()["id"]
+
+    primary_session = app.dependency_overrides[get_session]
+
+    def get_primary_session():
+        raise AssertionError("GET endpoint used the primary session")
+        yield
+
+    app.dependency_overrides[get_session] = get_primary_session
+    try:
+        for path in ["/api/v1/items/", f"/api/v1/items/{id}", "/api/v1/users/", "/api/v1/users/1"]:
+            response = client.get(path, headers={"Authorization": f"Bearer {token}"})
+            assert response.status_code == 200
+    finally:
+        app.dependency_overrides[get_session] = primary_session
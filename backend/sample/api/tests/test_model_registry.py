@@ -0,0 +1,86 @@
+import sys
+sys.path.append("/opt/app/api")
+
+import numpy as np
+import pytest
+from sklearn.datasets import load_iris
+from sklearn.linear_model import LogisticRegression
+
+from model_registry import ModelRegistry, ModelWatcher
+from script import to_onnx_bytes
+
+
+def onnx_bytes(n_features: int) -> bytes:
+    """irisデータセットの先頭 n_features 列で学習したモデルをONNX形式で返す"""
+    X, y = load_iris(return_X_y=True)
+    return to_onnx_bytes(LogisticRegression(max_iter=500).fit(X[:, :n_features], y))
+
+
+def test_registry_publish_and_activate(tmp_path):
+    """
+    登録するたびにバージョンが増え、activate で以前のバージョンに戻せます
+    """
+    registry = ModelRegistry(str(tmp_path))
+    assert registry.current_version() is None
+    assert registry.publish(onnx_bytes(4), {"n_features": 4}) == "v1"
+    assert registry.publish(onnx_bytes(4), {"n_features": 4}, activate=False) == "v2"
+    assert registry.list_versions() == ["v1", "v2"]
+    assert registry.current_version() == "v1"
+    assert registry.metadata("v2")["version"] == "v2"
+
+    registry.activate("v2")
+    assert registry.current_version() == "v2"
+    registry.activate("v1")
+    assert registry.current_version() == "v1"
+    with pytest.raises(ValueError):
+        registry.activate("v3")
+
+
+@pytest.mark.asyncio
+async def test_watcher_swaps_to_new_version(tmp_path):
+    """
+    CURRENT が変わると、新しいバージョンを読み込んでから切り替えます
+    """
+    registry = ModelRegistry(str(tmp_path))
+    registry.publish(onnx_bytes(4), {})
+    swapped = []
+    watcher = ModelWatcher(registry, swapped.append, warmup_runs=1, warmup_batch_size=2)
+    await watcher.refresh()
+    assert [model.version for model in swapped] == ["v1"]
+
+    # 変わっていなければ読み込み直さない
+    await watcher.refresh()
+    assert len(swapped) == 1
+
+    registry.publish(onnx_bytes(2), {})
+    await watcher.refresh()
+    assert [model.version for model in swapped] == ["v1", "v2"]
+    assert swapped[-1].n_features == 2
+    labels, _ = swapped[-1].predict(np.zeros((1, 2), dtype=np.float32))
+    assert len(labels) == 1
+
+
+@pytest.mark.asyncio
+async def test_watcher_keeps_model_when_load_fails(tmp_path):
+    """
+    壊れたモデルが登録されても切り替えず、同じバージョンの読み込みを繰り返しません
+    """
+    registry = ModelRegistry(str(tmp_path))
+    registry.publish(onnx_bytes(4), {})
+    swapped = []
+    watcher = ModelWatcher(registry, swapped.append, warmup_runs=1, warmup_batch_size=2)
+    await watcher.refresh()
+
+    registry.publish(b"not an onnx model", {})
+    await watcher.refresh()
+    assert [model.version for model in swapped] == ["v1"]
+    assert watcher.loaded_version == "v1"
+    assert watcher.failed_version == "v2"
+
+    # 壊れたバージョンは再試行しないため、読み込みは失敗しない
+    await watcher.check()
+
+    # 修正したバージョンを登録すれば切り替わる
+    registry.publish(onnx_bytes(4), {})
+    await watcher.refresh()
+    assert [model.version for model in swapped] == ["v1", "v3"]
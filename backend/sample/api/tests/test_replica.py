@@ -0,0 +1,71 @@
+import sys
+sys.path.append("/opt/app/api")
+
+import time
+
+from sqlalchemy import create_engine, text
+from starlette.requests import Request
+
+from session import READ_PRIMARY_COOKIE, ReplicaRouter, reads_from_primary
+
+
+def create_database(path, name):
+    """どのデータベースから読んだかが分かるよう、名前を1行だけ持つデータベースを作成する"""
+    engine = create_engine(f"sqlite:///{path}", pool_pre_ping=True)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE node (name TEXT)"))
+        conn.execute(text("INSERT INTO node VALUES (:name)"), {"name": name})
+    return engine
+
+
+def read_node(router):
+    with router.connect() as conn:
+        return conn.execute(text("SELECT name FROM node")).scalar()
+
+
+def make_request(headers=None, cookies=None):
+    raw_headers = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    if cookies:
+        raw_headers.append((b"cookie", "; ".join(f"{k}={v}" for k, v in cookies.items()).encode()))
+    return Request({"type": "http", "headers": raw_headers})
+
+
+def test_reads_are_distributed_round_robin(tmp_path):
+    """
+    読み取りがレプリカに順番に振り分けられ、プライマリには送られないことを確認する
+    """
+    primary = create_database(tmp_path / "primary.db", "primary")
+    replicas = [create_database(tmp_path / f"replica{i}.db", f"replica{i}") for i in range(2)]
+    router = ReplicaRouter(primary, replicas)
+
+    assert [read_node(router) for _ in range(4)] == ["replica0", "replica1", "replica0", "replica1"]
+
+
+def test_unavailable_replica_fails_over(tmp_path):
+    """
+    接続できないレプリカは外され、すべて使えない場合はプライマリから読むことを確認する
+    """
+    primary = create_database(tmp_path / "primary.db", "primary")
+    replica = create_database(tmp_path / "replica.db", "replica")
+    # 存在しないディレクトリのデータベースには接続できない
+    broken = create_engine(f"sqlite:///{tmp_path}/missing/replica.db", pool_pre_ping=True)
+
+    router = ReplicaRouter(primary, [broken, replica], retry_interval=60)
+    assert [read_node(router) for _ in range(3)] == ["replica", "replica", "replica"]
+    assert not router.is_available(0)
+
+    router = ReplicaRouter(primary, [broken], retry_interval=0)
+    assert read_node(router) == "primary"
+    # 待ち時間が過ぎたレプリカは再び振り分け先の候補になる
+    assert router.is_available(0)
+
+
+def test_read_your_writes_uses_primary():
+    """
+    書き込み直後のCookieやヘッダがある場合だけプライマリから読むことを確認する
+    """
+    assert not reads_from_primary(make_request())
+    assert reads_from_primary(make_request(headers={"X-Read-Primary": "true"}))
+    assert reads_from_primary(make_request(cookies={READ_PRIMARY_COOKIE: str(time.time() + 5)}))
+    assert not reads_from_primary(make_request(cookies={READ_PRIMARY_COOKIE: str(time.time() - 1)}))
+    assert not reads_from_primary(make_request(cookies={READ_PRIMARY_COOKIE: "invalid"}))
@@ -0,0 +1,44 @@
+from sqlalchemy import delete, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from model import Item, User
+
+
+def has_more_items_than(session: Session, user_id: int, count: int) -> bool:
+    """ユーザーのアイテムが count 件より多いかを確認する
+    すべてを数えずに、count+1 件目が存在するかだけをインデックスで確認する
+    """
+    statement = select(Item.id).where(Item.user_id == user_id).order_by(Item.id).offset(count).limit(1)
+    return session.execute(statement).first() is not None
+
+
+def delete_user(session: Session, user_id: int) -> bool:
+    """ユーザーを1回の DELETE で削除する
+    アイテムとロールの割り当ては外部キーの ON DELETE CASCADE でデータベースが削除する
+
+    :return: ユーザーが存在して削除した場合は True
+    """
+    statement = delete(User).where(User.id == user_id).execution_options(synchronize_session=False)
+    return session.execute(statement).rowcount > 0
+
+
+def purge_user(engine: Engine, user_id: int, batch_size: int) -> int:
+    """アイテムが多いユーザーを、アイテムを batch_size 件ずつ削除してから削除する
+    ON DELETE CASCADE で一度に削除するとトランザクションが長くなりロックも大きくなるため、
+    バッチごとにコミットする。途中で失敗しても、もう一度実行すれば続きから削除できる。
+
+    :return: 削除したアイテムの件数
+    """
+    deleted = 0
+    while True:
+        with Session(engine) as session:
+            ids = session.scalars(select(Item.id).where(Item.user_id == user_id).limit(batch_size)).all()
+            if not ids:
+                # 削除中に追加されたアイテムもここで ON DELETE CASCADE により削除される
+                delete_user(session, user_id)
+                session.commit()
+                return deleted
+            session.execute(delete(Item).where(Item.id.in_(ids)).execution_options(synchronize_session=False))
+            session.commit()
+            deleted += len(ids)
@@ -1,9 +1,11 @@
 import os
+import json
+from collections import deque
 from typing import List, Tuple, Optional, Literal
 from dotenv import load_dotenv  # Load environment variables from .env file.
 import gradio as gr
 import openai
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, or_, text
 from sqlalchemy.orm import declarative_base, sessionmaker
 from datetime import datetime
 
@@ -20,6 +22,23 @@ API_PROVIDERS = Literal["openai", "deepseek"]
 DEFAULT_MODEL = "gpt-3.5-turbo"
 DEEPSEEK_API_BASE = "https://api.deepseek.com"
 DEFAULT_TEMPERATURE = 0.7
+# 履歴検索の1ページあたりの件数
+SEARCH_PAGE_SIZE = 20
+# trigramトークナイザーで検索できる最小の文字数（これより短い語はLIKE検索にフォールバック）
+FTS_MIN_TERM_LENGTH = 3
+# 1回のリクエストで送信する会話履歴のトークン上限（環境変数 CONTEXT_TOKEN_BUDGET で変更可能）
+DEFAULT_CONTEXT_TOKEN_BUDGET = 3000
+# メッセージごとのロール・区切り記号分のオーバーヘッド（概算）
+MESSAGE_TOKEN_OVERHEAD = 4
+# 保持するペイロードサイズ記録の件数
+PAYLOAD_STATS_LIMIT = 1000
+
+def estimate_tokens(text: str) -> int:
+    """テキストのトークン数を概算する
+    英数字は約4文字で1トークン、日本語などの非ASCII文字は1文字1トークンとして数える
+    """
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
 
 # SQLiteデータベースの設定
 Base = declarative_base()
@@ -33,9 +52,45 @@ class ChatHistory(Base):
     model_name = Column(String, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+def init_search_index(engine) -> None:
+    """チャット履歴の全文検索用FTS5インデックスを作成し、トリガーでchat_historyと同期させる
+    日本語を部分一致で検索できるよう trigram トークナイザーを使用する
+    """
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_history_fts'")
+        ).first()
+        conn.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS chat_history_fts USING fts5(
+                question, answer, content='chat_history', content_rowid='id', tokenize='trigram'
+            )
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS chat_history_fts_insert AFTER INSERT ON chat_history BEGIN
+                INSERT INTO chat_history_fts(rowid, question, answer) VALUES (new.id, new.question, new.answer);
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS chat_history_fts_delete AFTER DELETE ON chat_history BEGIN
+                INSERT INTO chat_history_fts(chat_history_fts, rowid, question, answer)
+                VALUES ('delete', old.id, old.question, old.answer);
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS chat_history_fts_update AFTER UPDATE ON chat_history BEGIN
+                INSERT INTO chat_history_fts(chat_history_fts, rowid, question, answer)
+                VALUES ('delete', old.id, old.question, old.answer);
+                INSERT INTO chat_history_fts(rowid, question, answer) VALUES (new.id, new.question, new.answer);
+            END
+        """))
+        # 既存の履歴はインデックス作成時に一度だけ取り込む
+        if exists is None:
+            conn.execute(text("INSERT INTO chat_history_fts(chat_history_fts) VALUES ('rebuild')"))
+
 # データベースエンジンの初期化
 engine = create_engine("sqlite:///chat_history.db", echo=True)
 Base.metadata.create_all(engine)
+init_search_index(engine)
 Session = sessionmaker(bind=engine)
 
 class ChatHistoryManager:
@@ -57,6 +112,37 @@ class ChatHistoryManager:
     def get_history(self) -> List[ChatHistory]:
         """チャット履歴を取得"""
         return self.session.query(ChatHistory).order_by(ChatHistory.timestamp.desc()).all()
+
+    def search(self, keyword: str, page: int = 1, page_size: int = SEARCH_PAGE_SIZE) -> List[ChatHistory]:
+        """質問・回答をキーワードで全文検索し、関連度順に1ページ分を取得"""
+        terms = keyword.split()
+        if not terms:
+            return []
+        offset = (max(page, 1) - 1) * page_size
+
+        # trigramは3文字未満の語を検索できないため、その場合はLIKE検索で新しい順に返す
+        if any(len(term) < FTS_MIN_TERM_LENGTH for term in terms):
+            query = self.session.query(ChatHistory)
+            for term in terms:
+                pattern = f"%{term}%"
+                query = query.filter(or_(ChatHistory.question.like(pattern), ChatHistory.answer.like(pattern)))
+            return query.order_by(ChatHistory.id.desc()).offset(offset).limit(page_size).all()
+
+        # 各語をフレーズとしてエスケープし、AND検索する
+        match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        statement = text("""
+            SELECT chat_history.* FROM chat_history_fts
+            JOIN chat_history ON chat_history.id = chat_history_fts.rowid
+            WHERE chat_history_fts MATCH :match
+            ORDER BY chat_history_fts.rank
+            LIMIT :limit OFFSET :offset
+        """)
+        return (
+            self.session.query(ChatHistory)
+            .from_statement(statement)
+            .params(match=match, limit=page_size, offset=offset)
+            .all()
+        )
     
     def close(self) -> None:
         """セッションを閉じる"""
@@ -80,23 +166,73 @@ class ConfigManager:
         api_provider = os.getenv("API_PROVIDER", "openai").lower()
         return deepseek_api_key, api_provider
 
+    def get_token_budget(self) -> int:
+        """会話履歴のトークン上限を取得"""
+        return int(os.getenv("CONTEXT_TOKEN_BUDGET", DEFAULT_CONTEXT_TOKEN_BUDGET))
+
 class ChatServiceFactory:
     """適切なチャットサービスを生成するファクトリクラス"""
     
     @staticmethod
-    def create_service(api_provider: API_PROVIDERS, deepseek_api_key: Optional[str], history_manager: ChatHistoryManager) -> "ChatService":
+    def create_service(
+        api_provider: API_PROVIDERS,
+        deepseek_api_key: Optional[str],
+        history_manager: ChatHistoryManager,
+        token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+    ) -> "ChatService":
         """APIプロバイダーに基づいて適切なチャットサービスを生成"""
         if api_provider == "openai":
-            return OpenAIChatService(history_manager)
+            return OpenAIChatService(history_manager, token_budget)
         elif api_provider == "deepseek":
             if not deepseek_api_key:
                 raise ValueError("DeepSeek APIキーが必要です")
-            return DeepSeekChatService(deepseek_api_key, history_manager)
+            return DeepSeekChatService(deepseek_api_key, history_manager, token_budget)
         raise ValueError(f"サポートされていないAPIプロバイダー: {api_provider}")
 
 class ChatService:
     """チャットサービスの基底クラス"""
-    
+
+    def __init__(self, history_manager: ChatHistoryManager, token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET):
+        self.history_manager = history_manager
+        self.token_budget = token_budget
+        # ターンごとの送信ペイロードのサイズ（メッセージ数・推定トークン数・バイト数）。直近分のみ保持する
+        self.payload_stats: deque = deque(maxlen=PAYLOAD_STATS_LIMIT)
+
+    def build_payload(self, history: ConversationHistory) -> ConversationHistory:
+        """トークン上限に収まるよう古いターンを切り詰めて、APIに送信するメッセージを組み立てる
+        systemメッセージと最新のユーザーメッセージは常に残す
+        """
+        system_messages = [m for m in history if m["role"] == "system"]
+        turns = [m for m in history if m["role"] != "system"]
+
+        used = sum(estimate_tokens(m["content"]) + MESSAGE_TOKEN_OVERHEAD for m in system_messages)
+        kept: ConversationHistory = []
+        # 新しいメッセージから順に、上限に達するまで採用する
+        for message in reversed(turns):
+            tokens = estimate_tokens(message["content"]) + MESSAGE_TOKEN_OVERHEAD
+            if kept and used + tokens > self.token_budget:
+                break
+            kept.append(message)
+            used += tokens
+        kept.reverse()
+        # assistantの発言から始まらないよう、先頭をユーザーメッセージに揃える
+        while len(kept) > 1 and kept[0]["role"] != "user":
+            used -= estimate_tokens(kept[0]["content"]) + MESSAGE_TOKEN_OVERHEAD
+            kept.pop(0)
+
+        payload = system_messages + kept
+        self.payload_stats.append({
+            "messages": len(payload),
+            "dropped": len(turns) - len(kept),
+            "estimated_tokens": used,
+            "payload_bytes": len(json.dumps(payload, ensure_ascii=False).encode("utf-8")),
+        })
+        return payload
+
+    def get_last_payload_stats(self) -> Optional[dict]:
+        """直近のターンで送信したペイロードのサイズを取得"""
+        return self.payload_stats[-1] if self.payload_stats else None
+
     def send_chat(self, user_message: str, history: Optional[ConversationHistory]) -> Tuple[ConversationHistory, ConversationHistory]:
         """チャットメッセージを送信し、会話履歴を更新"""
         raise NotImplementedError("サブクラスで実装が必要です")
@@ -107,8 +243,8 @@ class ChatService:
 class OpenAIChatService(ChatService):
     """OpenAI用のチャットサービス実装"""
     
-    def __init__(self, history_manager: ChatHistoryManager):
-        self.history_manager = history_manager
+    def __init__(self, history_manager: ChatHistoryManager, token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET):
+        super().__init__(history_manager, token_budget)
         
     def get_model_name(self) -> str:
         return DEFAULT_MODEL
@@ -121,7 +257,7 @@ class OpenAIChatService(ChatService):
         try:
             response = openai.ChatCompletion.create(
                 model=DEFAULT_MODEL,
-                messages=history,
+                messages=self.build_payload(history),
                 temperature=DEFAULT_TEMPERATURE
             )
             assistant_reply = response.choices[0].message.content.strip()
@@ -136,9 +272,9 @@ class OpenAIChatService(ChatService):
 class DeepSeekChatService(ChatService):
     """DeepSeek用のチャットサービス実装"""
     
-    def __init__(self, api_key: str, history_manager: ChatHistoryManager):
+    def __init__(self, api_key: str, history_manager: ChatHistoryManager, token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET):
+        super().__init__(history_manager, token_budget)
         self.api_key = api_key
-        self.history_manager = history_manager
         
     def get_model_name(self) -> str:
         return "deepseek-chat" if USE_DEEPSEEK_CHAT_MODEL else "deepseek-reasoner"
@@ -153,7 +289,7 @@ class DeepSeekChatService(ChatService):
                 api_key=self.api_key,
                 api_base=DEEPSEEK_API_BASE,
                 model=model_name,
-                messages=history,
+                messages=self.build_payload(history),
                 temperature=DEFAULT_TEMPERATURE
             )
             assistant_reply = response.choices[0].message.content.strip()
@@ -177,11 +313,21 @@ class DeepSeekChatService(ChatService):
 config_manager = ConfigManager()
 deepseek_api_key, api_provider = config_manager.get_api_keys()
 history_manager = ChatHistoryManager()
-chat_service = ChatServiceFactory.create_service(api_provider, deepseek_api_key, history_manager)
+chat_service = ChatServiceFactory.create_service(
+    api_provider, deepseek_api_key, history_manager, config_manager.get_token_budget()
+)
 
-def chat(user_message: str, history: Optional[ConversationHistory]) -> Tuple[ConversationHistory, ConversationHistory]:
-    """チャットメッセージを処理し、更新された会話履歴を返す"""
-    return chat_service.send_chat(user_message, history)
+def chat(user_message: str, history: Optional[ConversationHistory]) -> Tuple[ConversationHistory, ConversationHistory, str]:
+    """チャットメッセージを処理し、更新された会話履歴と送信ペイロードのサイズを返す"""
+    history, state = chat_service.send_chat(user_message, history)
+    stats = chat_service.get_last_payload_stats()
+    info = ""
+    if stats:
+        info = (
+            f"送信コンテキスト: {stats['messages']}件 / 約{stats['estimated_tokens']} tokens"
+            f" / {stats['payload_bytes']} bytes（省略 {stats['dropped']}件）"
+        )
+    return history, state, info
 
 def toggle_history(history_display):
     """チャット履歴の表示/非表示を切り替える"""
@@ -195,6 +341,14 @@ def toggle_history(history_display):
         return gr.update(visible=True, value=history_data)
     return gr.update(visible=False)
 
+def search_history(keyword: str, page: float):
+    """チャット履歴を全文検索し、検索結果の1ページ分を返す"""
+    results = history_manager.search(keyword, int(page or 1))
+    return [
+        [h.id, h.question, h.answer, h.model_name, h.timestamp.strftime("%Y-%m-%d %H:%M:%S")]
+        for h in results
+    ]
+
 # Set up Gradio UI components.
 with gr.Blocks() as demo:
     gr.Markdown("# AI Chatbot")
@@ -202,6 +356,8 @@ with gr.Blocks() as demo:
     
     # Chatbotコンポーネントを新しい形式で初期化
     chatbot = gr.Chatbot(label="Chatbot", type="messages")
+    # 直近のターンで送信したペイロードのサイズ
+    payload_info = gr.Markdown()
     
     # チャット履歴表示用のコンポーネント
     history_display = gr.Dataframe(
@@ -227,16 +383,28 @@ with gr.Blocks() as demo:
         )
         history_button = gr.Button("履歴表示")
     
+    # チャット履歴の全文検索
+    with gr.Row():
+        search_input = gr.Textbox(label="履歴検索", placeholder="キーワードを入力...")
+        search_page = gr.Number(label="ページ", value=1, minimum=1, precision=0)
+        search_button = gr.Button("検索")
+    search_results = gr.Dataframe(
+        headers=["ID", "質問", "回答", "モデル", "日時"],
+        interactive=False
+    )
+    
     state = gr.State([])
     
-    text_input.submit(fn=chat, inputs=[text_input, state], outputs=[chatbot, state])
+    text_input.submit(fn=chat, inputs=[text_input, state], outputs=[chatbot, state, payload_info])
     send_button = gr.Button("Send")
-    send_button.click(fn=chat, inputs=[text_input, state], outputs=[chatbot, state])
+    send_button.click(fn=chat, inputs=[text_input, state], outputs=[chatbot, state, payload_info])
     history_button.click(
         fn=toggle_history,
         inputs=[history_display],
         outputs=[history_display]  # gr.update() を使うので .visible は不要
     )
+    search_input.submit(fn=search_history, inputs=[search_input, search_page], outputs=[search_results])
+    search_button.click(fn=search_history, inputs=[search_input, search_page], outputs=[search_results])
 
 if __name__ == "__main__":
     try:
@@ -1,26 +1,65 @@
+import sys
+from os.path import abspath, dirname
+
 import gradio as gr
 import requests
 
-def get_microposts():
+sys.path.append(dirname(dirname(abspath(__file__))))  # frontend ディレクトリをパスに追加
+from micropost_client import MicropostClient, MicropostFeed, DEFAULT_PAGE_SIZE, DEFAULT_REFRESH_INTERVAL
+
+# Share one pooled, caching client across every button press.
+client = MicropostClient()
+
+def get_microposts(page: float = 1):
     """
-    Retrieve actual microposts from a real REST API endpoint.
+    Retrieve one page of microposts from the REST API endpoint.
     """
     try:
-        # Call an external REST API endpoint.
-        response = requests.get("http://localhost:3000/api/v1/microposts")
-        response.raise_for_status()
-        posts = response.json()
+        result = client.get_microposts(page=int(page or 1), page_size=DEFAULT_PAGE_SIZE)
         # Format the microposts for display.
-        output_str = "\n".join([f"ID: {post['id']} - Title: {post['title']}" for post in posts])
+        output_str = "\n".join([f"ID: {post['id']} - Title: {post['title']}" for post in result.items])
+        if result.total is not None:
+            output_str += f"\n\n(page {result.page}, {result.total} microposts in total)"
         return output_str
     except requests.RequestException as e:
         return f"Error: {e}"
 
+def refresh_feed(feed: MicropostFeed):
+    """
+    Append microposts newer than the last seen id to the live table.
+    """
+    try:
+        new_posts = feed.refresh()
+        status = f"{len(new_posts)} new / {len(feed.posts)} buffered (last id: {feed.last_id})"
+    except requests.RequestException as e:
+        status = f"Error: {e}"
+    return feed.rows(), feed, status
+
+def toggle_auto_refresh(enabled: bool):
+    """
+    Start or stop polling for new microposts.
+    """
+    return gr.Timer(active=enabled)
+
 with gr.Blocks() as demo:
     gr.Markdown("## GET /api/v1/microposts")
     output_text = gr.Textbox(label="Microposts", lines=5)
+    page_input = gr.Number(label="Page", value=1, minimum=1, precision=0)
     get_button = gr.Button("Get Microposts")
-    get_button.click(fn=get_microposts, inputs=[], outputs=output_text)
+    get_button.click(fn=get_microposts, inputs=[page_input], outputs=output_text)
+
+    gr.Markdown("## Live microposts")
+    # One feed per browser session; each keeps its own last seen id and bounded buffer.
+    feed_state = gr.State(lambda: MicropostFeed(client))
+    auto_refresh = gr.Checkbox(label=f"Auto refresh (every {DEFAULT_REFRESH_INTERVAL:g}s)", value=False)
+    feed_status = gr.Markdown()
+    feed_table = gr.Dataframe(headers=["ID", "Title"], interactive=False)
+    timer = gr.Timer(DEFAULT_REFRESH_INTERVAL, active=False)
+    timer.tick(fn=refresh_feed, inputs=[feed_state], outputs=[feed_table, feed_state, feed_status])
+    auto_refresh.change(fn=toggle_auto_refresh, inputs=[auto_refresh], outputs=[timer])
 
 if __name__ == "__main__":
-    demo.launch()
\ No newline at end of file
+    try:
+        demo.launch()
+    finally:
+        client.close()
@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Micropost API settings shared by the Gradio and Streamlit frontends.
+API_BASE_URL = os.getenv("MICROPOST_API_URL", "http://localhost:3000/api/v1")
+DEFAULT_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+DEFAULT_CACHE_TTL = 5.0  # seconds a response is served without contacting the API
+DEFAULT_PAGE_SIZE = 50
+DEFAULT_POOL_SIZE = 10
+DEFAULT_FEED_BUFFER_SIZE = 500  # newest microposts kept in memory by a live feed
+DEFAULT_REFRESH_INTERVAL = 5.0  # seconds between live feed polls
+
+
+class MicropostPage(NamedTuple):
+    """One page of microposts returned by the API."""
+    items: List[dict]
+    total: Optional[int]  # value of X-Total-Count, None when the API does not send it
+    page: int
+    page_size: int
+
+
+class _CacheEntry(NamedTuple):
+    fetched_at: float
+    etag: Optional[str]
+    data: object
+    total: Optional[int]
+
+
+class MicropostClient:
+    """
+    HTTP client for the micropost REST API.
+
+    Keeps a pooled keep-alive session, applies timeouts to every request and
+    caches responses for a short TTL. Once the TTL expires, the cached ETag is
+    sent as If-None-Match so an unchanged list costs a 304 instead of a full body.
+    """
+
+    def __init__(
+        self,
+        base_url: str = API_BASE_URL,
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+        cache_ttl: float = DEFAULT_CACHE_TTL,
+        pool_size: int = DEFAULT_POOL_SIZE,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504), allowed_methods=("GET",)),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._cache: Dict[str, _CacheEntry] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, path: str, params: Optional[dict] = None) -> _CacheEntry:
+        """GET a resource, serving it from the cache or revalidating it with its ETag."""
+        params = params or {}
+        key = f"{path}?{urlencode(sorted(params.items()))}"
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None and time.monotonic() - cached.fetched_at < self.cache_ttl:
+            return cached
+
+        headers = {}
+        if cached is not None and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        response = self.session.get(f"{self.base_url}{path}", params=params, headers=headers, timeout=self.timeout)
+
+        if response.status_code == 304 and cached is not None:
+            entry = cached._replace(fetched_at=time.monotonic())
+        else:
+            response.raise_for_status()
+            total = response.headers.get("X-Total-Count")
+            entry = _CacheEntry(
+                fetched_at=time.monotonic(),
+                etag=response.headers.get("ETag"),
+                data=response.json(),
+                total=int(total) if total is not None else None,
+            )
+        with self._lock:
+            self._cache[key] = entry
+        return entry
+
+    def get_microposts(
+        self,
+        page: int = 1,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        sort: Optional[str] = None,
+        order: str = "asc",
+        title: Optional[str] = None,
+    ) -> MicropostPage:
+        """Retrieve one page of microposts (pages start at 1).
+        Sorting ('id' or 'title', 'asc' or 'desc') and the title substring filter are applied by the API.
+        """
+        page = max(page, 1)
+        params = {"offset": (page - 1) * page_size, "limit": page_size}
+        if sort:
+            params.update(sort=sort, order=order)
+        if title:
+            params["title"] = title
+        entry = self._get("/microposts", params)
+        return MicropostPage(items=entry.data, total=entry.total, page=page, page_size=page_size)
+
+    def get_microposts_since(self, since_id: int, limit: int = DEFAULT_PAGE_SIZE) -> List[dict]:
+        """Retrieve up to `limit` microposts newer than `since_id`, oldest first.
+        Deltas are not cached since every poll asks for a different id.
+        """
+        response = self.session.get(
+            f"{self.base_url}/microposts",
+            params={"since_id": since_id, "limit": limit},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def get_latest_microposts(self, count: int) -> List[dict]:
+        """Retrieve the newest `count` microposts, oldest first."""
+        total = self.get_microposts(page=1, page_size=1).total
+        if total is None:
+            return []
+        response = self.session.get(
+            f"{self.base_url}/microposts",
+            params={"offset": max(total - count, 0), "limit": count},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def get_micropost(self, micropost_id: int) -> dict:
+        """Retrieve a single micropost by its id."""
+        return self._get(f"/microposts/{micropost_id}").data
+
+    def clear_cache(self) -> None:
+        """Drop every cached response."""
+        with self._lock:
+            self._cache.clear()
+
+    def close(self) -> None:
+        """Close the pooled connections."""
+        self.session.close()
+
+
+class MicropostFeed:
+    """
+    Live view of the newest microposts.
+
+    Each refresh asks the API only for microposts newer than the last seen id
+    and appends them to a bounded buffer, so polling costs a small delta
+    instead of the whole list.
+    """
+
+    def __init__(self, client: MicropostClient, buffer_size: int = DEFAULT_FEED_BUFFER_SIZE):
+        self.client = client
+        self.posts: deque = deque(maxlen=buffer_size)
+        self.last_id = 0
+
+    def refresh(self, max_pages: int = 10) -> List[dict]:
+        """Fetch microposts newer than the last seen id and return the new ones."""
+        new_posts: List[dict] = []
+        if self.last_id == 0:
+            # Initial load: only the newest posts that fit in the buffer, not the full history
+            new_posts = self.client.get_latest_microposts(self.posts.maxlen)
+            if new_posts:
+                self.last_id = max(post["id"] for post in new_posts)
+        for _ in range(max_pages):
+            batch = self.client.get_microposts_since(self.last_id)
+            if not batch:
+                break
+            new_posts.extend(batch)
+            self.last_id = max(self.last_id, max(post["id"] for post in batch))
+            if len(batch) < DEFAULT_PAGE_SIZE:
+                break
+        self.posts.extend(new_posts)
+        return new_posts
+
+    def rows(self) -> List[List]:
+        """Buffered microposts as table rows, newest first."""
+        return [[post["id"], post["title"]] for post in reversed(self.posts)]
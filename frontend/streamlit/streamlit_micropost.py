@@ -1,25 +1,83 @@
+import math
+import sys
+from os.path import abspath, dirname
+
+import pandas as pd
 import streamlit as st
 import requests
 
-def get_microposts():
+sys.path.append(dirname(dirname(abspath(__file__))))  # frontend ディレクトリをパスに追加
+from micropost_client import MicropostClient, MicropostFeed, DEFAULT_CACHE_TTL, DEFAULT_PAGE_SIZE, DEFAULT_REFRESH_INTERVAL
+
+@st.cache_resource
+def get_client():
     """
-    Retrieve microposts from the external REST API endpoint.
+    Create one pooled micropost client shared across reruns and sessions.
+    Response caching is left to st.cache_data; the client still revalidates with ETags.
     """
-    api_url = "http://localhost:3000/api/v1/microposts"  # API endpoint
-    try:
-        response = requests.get(api_url)
-        response.raise_for_status()  # Raise exception for HTTP errors
-        return response.json()  # Parse JSON response into Python data structure
-    except requests.RequestException as e:
-        st.error(f"API request failed: {e}")
-        return None
+    return MicropostClient(cache_ttl=0)
+
+@st.cache_data(ttl=DEFAULT_CACHE_TTL)
+def get_microposts_frame(page: int, page_size: int, sort: str, order: str, title: str):
+    """
+    Retrieve one page of microposts, sorted and filtered by the API, as an Arrow-backed DataFrame.
+    Only the requested page is ever downloaded or rendered.
+    """
+    result = get_client().get_microposts(page=page, page_size=page_size, sort=sort, order=order, title=title or None)
+    frame = pd.DataFrame(result.items, columns=["id", "title"]).convert_dtypes(dtype_backend="pyarrow")
+    return frame, result.total
 
 # Main Streamlit UI
 st.title("GET /api/v1/microposts Demo")
 
-if st.button("Fetch Microposts"):
-    microposts = get_microposts()
-    if microposts is not None:
-        # Display the fetched microposts in a pretty JSON format
-        st.json(microposts)
+# Column filters and sorting are sent to the API so paging stays server-side.
+filter_col, sort_col, order_col, size_col = st.columns([3, 2, 2, 2])
+title_filter = filter_col.text_input("Title contains")
+sort = sort_col.selectbox("Sort by", ["id", "title"])
+order = order_col.selectbox("Order", ["desc", "asc"])
+page_size = size_col.selectbox("Rows per page", [25, DEFAULT_PAGE_SIZE, 100, 500], index=1)
+
+# Reset to the first page whenever the query changes.
+query = (title_filter, sort, order, page_size)
+if st.session_state.get("micropost_query") != query:
+    st.session_state.micropost_query = query
+    st.session_state.micropost_page = 1
+
+try:
+    frame, total = get_microposts_frame(st.session_state.micropost_page, page_size, sort, order, title_filter)
+except requests.RequestException as e:
+    st.error(f"API request failed: {e}")
+else:
+    page_count = max(math.ceil((total or 0) / page_size), 1)
+    if st.session_state.micropost_page > page_count:
+        # The feed shrank below the current page; jump to the last page.
+        st.session_state.micropost_page = page_count
+        st.rerun()
+    page = st.number_input("Page", min_value=1, max_value=page_count, step=1, key="micropost_page")
+    if total is not None:
+        st.caption(f"page {page} / {page_count} ({total} microposts)")
+    st.dataframe(frame, use_container_width=True, hide_index=True)
+
+# Live microposts: poll only for posts newer than the last seen id
+st.header("Live microposts")
+
+if "feed" not in st.session_state:
+    # One feed per browser session; each keeps its own last seen id and bounded buffer.
+    st.session_state.feed = MicropostFeed(get_client())
+
+auto_refresh = st.toggle(f"Auto refresh (every {DEFAULT_REFRESH_INTERVAL:g}s)")
+
+@st.fragment(run_every=DEFAULT_REFRESH_INTERVAL if auto_refresh else None)
+def live_feed():
+    """
+    Append new microposts to the live table; only this fragment reruns on each poll.
+    """
+    feed = st.session_state.feed
+    try:
+        new_posts = feed.refresh()
+        st.caption(f"{len(new_posts)} new / {len(feed.posts)} buffered (last id: {feed.last_id})")
+    except requests.RequestException as e:
+        st.error(f"API request failed: {e}")
+    st.dataframe(list(reversed(feed.posts)), use_container_width=True)
 
+live_feed()